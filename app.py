@@ -1,21 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, session,
+                   jsonify, Response, stream_with_context, make_response)
 import os
 import json
+import csv
+import io
+import base64
+import binascii
+from functools import wraps
+from itertools import islice
 from datetime import datetime, timedelta
 import pytz
 import random
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from collections import defaultdict
-from collections import defaultdict
 from calendar import monthrange
 import calendar
+from attendance_storage import load_settings, open_storage, SETTINGS_FILE, STATUS_CATEGORIES
+from attendance_index import AttendanceIndex, ROLLUP_FIELDS
+from user_registry import UserRegistry
+from search_index import SearchIndex
+from response_cache import DataVersion, ResponseCache
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
 app.config['UPLOAD_FOLDER'] = 'face_data'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
+# JSON files or SQLite, as selected by "storage_backend" in settings.json
+storage = open_storage()
+# Built once per process and refreshed by polling, so requests never rescan the storage
+attendance_index = AttendanceIndex(storage)
+# Users are re-read only when the storage changes; views are read-only
+user_registry = UserRegistry(storage)
+# Trigram index over students and attendance, kept current by both of the above
+search_index = SearchIndex(attendance_index, user_registry)
+# Bumped by every indexed attendance change and every user change
+data_version = DataVersion().watch(attendance_index, user_registry)
+# Rendered pages keyed by (route, user, data version)
+response_cache = ResponseCache()
+SEARCH_PAGE_SIZE = 50
+SEARCH_RESULT_LIMIT = 1000
+API_PAGE_SIZE = 100
+API_PAGE_LIMIT = 1000
+API_CSV_FIELDS = ['date', 'student_id', 'name', 'department', 'time', 'status']
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 VALID_DEPARTMENTS = ['IT', 'Chemistry', 'English', 'Microbiology']
 SECURITY_QUESTIONS = {
@@ -29,15 +57,50 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def load_user_data():
-    try:
-        with open('user_records.json', 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return user_registry.all()
+
+def save_user(student_id, info):
+    user_registry.save(student_id, info)
 
-def save_user_data(data):
-    with open('user_records.json', 'w') as f:
-        json.dump(data, f, indent=4)
+def current_data_version():
+    # Polling the sources first lets pending changes bump the version
+    attendance_index.refresh()
+    user_registry.all()
+    try:
+        settings_mtime = os.stat(SETTINGS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        settings_mtime = None
+    return data_version.value, settings_mtime
+
+def cached_page(view):
+    """Serve a logged-in page from response_cache until the data version moves on.
+
+    Responses carry a strong ETag of the body, so a browser revalidating
+    with If-None-Match gets a 304 without the page being rendered again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Flashed messages show only once, so pages carrying them are never cached
+        if 'user_id' not in session or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        # The pages work out windows and the current month from datetime.now(),
+        # so a new day invalidates them even without a write
+        today = datetime.now().strftime('%Y-%m-%d')
+        key = (request.full_path, session['user_id'], current_data_version(), today)
+        entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or '_flashes' in session:
+                return response
+            entry = response_cache.put(key, response.get_data(), response.mimetype)
+
+        etag, body, mimetype = entry
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return wrapper
 
 def generate_student_id(user_data):
     while True:
@@ -45,56 +108,18 @@ def generate_student_id(user_data):
         if student_id not in user_data:
             return student_id
 
-def get_attendance_files():
-    return [f for f in os.listdir('.') if f.startswith('attendance_') and f.endswith('.json')]
-
-
 def calculate_attendance_stats(student_id):
-    """Calculate detailed attendance statistics for a student"""
-    attendance_data = defaultdict(list)
-    monthly_stats = defaultdict(lambda: {'present': 0, 'late': 0, 'absent': 0})
-
-    # Get all attendance records
-    for file in get_attendance_files():
-        with open(file, 'r') as f:
-            data = json.load(f)
-            for date, entries in data.items():
-                year_month = date[:7]  # Get YYYY-MM from YYYY-MM-DD
-                if student_id in entries:
-                    entry = entries[student_id]
-                    attendance_data[date].append(entry)
-
-                    # Update monthly statistics
-                    if 'Late' in entry['status']:
-                        monthly_stats[year_month]['late'] += 1
-                    else:
-                        monthly_stats[year_month]['present'] += 1
-                else:
-                    # If no entry for this date, count as absent
-                    monthly_stats[year_month]['absent'] += 1
-
-    return attendance_data, monthly_stats
+    """Detailed attendance statistics for a student, read from the materialised aggregates"""
+    return attendance_index.student_summary(student_id)
 def get_student_records(student_id):
     records = []
-    for file in get_attendance_files():
-        with open(file, 'r') as f:
-            data = json.load(f)
-            for date, entries in data.items():
-                if student_id in entries:
-                    record = entries[student_id]
-                    record['date'] = date
-                    records.append(record)
-    return sorted(records, key=lambda x: x['date'], reverse=True)
+    for date, record in attendance_index.student_records(student_id):
+        record['date'] = date
+        records.append(record)
+    return records
 
 def count_lates(student_id):
-    count = 0
-    for file in get_attendance_files():
-        with open(file, 'r') as f:
-            data = json.load(f)
-            for entries in data.values():
-                if student_id in entries and "Late" in entries[student_id].get('status', ''):
-                    count += 1
-    return count
+    return attendance_index.count_lates(student_id)
 
 @app.route('/')
 def home():
@@ -139,7 +164,7 @@ def register():
         photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         photo.save(photo_path)
 
-        user_data[student_id] = {
+        user = {
             'name': name,
             'department': department,
             'photo_path': photo_path,
@@ -148,7 +173,7 @@ def register():
             'security_answer': generate_password_hash(security_answer.lower()),  # Store hashed answer
             'registration_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        save_user_data(user_data)
+        save_user(student_id, user)
 
         flash(f'Registration successful! Your Student ID is {student_id}', 'success')
         return redirect(url_for('login'))
@@ -198,8 +223,9 @@ def forgot_password():
                                          student_id=student_id,
                                          verified='true')
 
-                user_data[student_id]['password'] = generate_password_hash(password)
-                save_user_data(user_data)
+                user = dict(user_data[student_id])
+                user['password'] = generate_password_hash(password)
+                save_user(student_id, user)
                 flash('Password has been reset successfully', 'success')
                 return redirect(url_for('login'))
 
@@ -223,64 +249,19 @@ def personal_dashboard():
     user_data = load_user_data()
     user = user_data[user_id]
 
-    # Calculate attendance statistics
+    # Attendance statistics are maintained as marks are written
+    summary = calculate_attendance_stats(user_id)
     attendance_stats = {
-        'total_days': 0,
-        'present_days': 0,
-        'late_days': 0,
+        'total_days': summary['total_days'],
+        'present_days': summary['present_days'],
+        'late_days': summary['late_days'],
         'absent_days': 0,
-        'last_attendance': None,
-        'streak': 0,
-        'recent_records': []
+        'last_attendance': summary['last_attendance'],
+        'streak': summary['max_streak'],
+        'current_streak': summary['current_streak'],
+        'recent_records': summary['recent_records']
     }
 
-    current_streak = 0
-    last_date = None
-
-    # Process attendance records
-    for file in get_attendance_files():
-        with open(file, 'r') as f:
-            data = json.load(f)
-            for date, entries in sorted(data.items(), reverse=True):
-                if user_id in entries:
-                    entry = entries[user_id]
-                    attendance_stats['total_days'] += 1
-
-                    # Update last attendance
-                    if not attendance_stats['last_attendance']:
-                        attendance_stats['last_attendance'] = {
-                            'date': date,
-                            'time': entry['time'],
-                            'status': entry['status']
-                        }
-
-                    # Calculate streak
-                    current_date = datetime.strptime(date, '%Y-%m-%d').date()
-                    if last_date:
-                        if (last_date - current_date).days == 1:
-                            current_streak += 1
-                        else:
-                            current_streak = 1
-                    else:
-                        current_streak = 1
-
-                    last_date = current_date
-                    attendance_stats['streak'] = max(attendance_stats['streak'], current_streak)
-
-                    # Count status
-                    if 'Late' in entry['status']:
-                        attendance_stats['late_days'] += 1
-                    else:
-                        attendance_stats['present_days'] += 1
-
-                    # Add to recent records (keep last 5)
-                    if len(attendance_stats['recent_records']) < 5:
-                        attendance_stats['recent_records'].append({
-                            'date': date,
-                            'time': entry['time'],
-                            'status': entry['status']
-                        })
-
     # Calculate absent days
     total_school_days = attendance_stats['total_days']  # You might want to calculate this differently
     attendance_stats['absent_days'] = total_school_days - (
@@ -302,7 +283,8 @@ def profile_settings():
 
     user_id = session['user_id']
     user_data = load_user_data()
-    user = user_data[user_id]
+    # Registry views are read-only; edit a copy and save it back
+    user = dict(user_data[user_id])
 
     if request.method == 'POST':
         # Update basic information
@@ -327,8 +309,7 @@ def profile_settings():
             user['password'] = generate_password_hash(new_password)
 
         # Save changes
-        user_data[user_id] = user
-        save_user_data(user_data)
+        save_user(user_id, user)
 
         flash('Profile updated successfully.', 'success')
         return redirect(url_for('personal_dashboard'))
@@ -348,6 +329,7 @@ def contact():
 
     return render_template('contact.html')
 @app.route('/attendance_summary')
+@cached_page
 def attendance_summary():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -356,12 +338,12 @@ def attendance_summary():
     user_data = load_user_data()
 
     # Get attendance statistics
-    attendance_data, monthly_stats = calculate_attendance_stats(student_id)
+    summary = calculate_attendance_stats(student_id)
+    monthly_stats = summary['months']
 
     # Calculate overall statistics
-    total_days = sum(len(days) for days in attendance_data.values())
-    total_late = sum(1 for days in attendance_data.values()
-                     for entry in days if 'Late' in entry['status'])
+    total_days = summary['total_days']
+    total_late = summary['late_days']
 
     # Get current month's working days
     current_month = datetime.now().strftime('%Y-%m')
@@ -385,35 +367,30 @@ def attendance_summary():
                            months=months,
                            attendance_counts=attendance_counts)
 @app.route('/dashboard')
+@cached_page
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    attendance_data = defaultdict(list)
-    total_lates = 0
-    department_count = defaultdict(int)
-
-    for file in get_attendance_files():
-        with open(file, 'r') as f:
-            daily_data = json.load(f)
-            for date, entries in daily_data.items():
-                attendance_data[date].extend(entries.values())
-                for entry in entries.values():
-                    department = entry.get('department', 'Unknown')
-                    status = entry.get('status', '')
+    total_lates = attendance_index.late_total()
+    department_count = attendance_index.department_counts()
 
-                    department_count[department] += 1
-                    if "Late" in status:
-                        total_lates += 1
-
-    dates = sorted(attendance_data.keys())[-7:]
-    daily_counts = [len(attendance_data[date]) for date in dates]
+    # Per-day, per-department rollup kept current on write; cost is independent of history
+    last_week = attendance_index.daily_rollup(last=7)
+    dates = [date for date, _ in last_week]
+    daily_status = {
+        field: [sum(counts[field] for counts in departments.values()) for _, departments in last_week]
+        for field in ROLLUP_FIELDS
+    }
+    department_rollup = {date: departments for date, departments in last_week}
 
     return render_template('dashboard.html',
                            total_students=len(load_user_data()),
                            total_lates=total_lates,
                            dates=json.dumps(dates),
-                           daily_counts=json.dumps(daily_counts),
+                           daily_counts=json.dumps(daily_status['present']),
+                           daily_status=json.dumps(daily_status),
+                           department_rollup=json.dumps(department_rollup),
                            department_count=json.dumps(department_count))
 
 @app.route('/profile')
@@ -437,22 +414,42 @@ def profile():
                            lates=lates)
 
 @app.route('/warnings')
+@cached_page
 def warnings():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
+    # Thresholds come from settings.json and can be overridden per request;
+    # 0 is a real value for both, and a window of 0 days means all time
+    settings = load_settings()
+    threshold = request.args.get('threshold', type=int)
+    if threshold is None:
+        threshold = settings.get('late_warning_threshold', 3)
+    window_days = request.args.get('days', type=int)
+    if window_days is None:
+        window_days = settings.get('late_warning_window_days')
+    start = None
+    if window_days is not None and window_days > 0:
+        start = (datetime.now() - timedelta(days=window_days - 1)).strftime('%Y-%m-%d')
+
+    # One pass over all students instead of one history scan per student
     warnings = []
     user_data = load_user_data()
-    for student_id in user_data:
-        late_count = count_lates(student_id)
-        if late_count >= 3:
+    late_warnings = attendance_index.late_warnings(threshold, start=start)
+    if threshold <= 0:
+        # Students without any late mark also reach a threshold of 0
+        listed = {student_id for student_id, _ in late_warnings}
+        late_warnings += [(student_id, 0) for student_id in sorted(user_data) if student_id not in listed]
+    for student_id, late_count in late_warnings:
+        if student_id in user_data:
             warnings.append({
                 'student': user_data[student_id],
                 'late_count': late_count,
                 'student_id': student_id
             })
 
-    return render_template('warnings.html', warnings=warnings)
+    return render_template('warnings.html', warnings=warnings,
+                           threshold=threshold, window_days=window_days)
 
 
 @app.route('/search', methods=['GET'])
@@ -462,44 +459,141 @@ def search():
 
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'students')
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(max(1, request.args.get('per_page', SEARCH_PAGE_SIZE, type=int)), SEARCH_RESULT_LIMIT)
 
     results = []
+    total = 0
     if query:
         user_data = load_user_data()
 
         if search_type == 'students':
-            # Search through students
-            for student_id, data in user_data.items():
-                if (query.lower() in data['name'].lower() or
-                        query.lower() in student_id.lower() or
-                        query.lower() in data['department'].lower()):
+            # Best matches first: exact, then prefix, then department, then substring
+            student_ids, total = search_index.search_students(
+                query, page=page, per_page=per_page, limit=SEARCH_RESULT_LIMIT
+            )
+            for student_id in student_ids:
+                if student_id in user_data:
                     results.append({
                         'student_id': student_id,
-                        **data
+                        **user_data[student_id]
                     })
         else:
-            # Search through attendance records
-            for file in get_attendance_files():
-                with open(file, 'r') as f:
-                    data = json.load(f)
-                    for date, entries in data.items():
-                        for student_id, entry in entries.items():
-                            if (query.lower() in entry['name'].lower() or
-                                    query.lower() in student_id.lower() or
-                                    query.lower() in entry['department'].lower()):
-                                results.append({
-                                    'date': date,
-                                    'student_id': student_id,
-                                    **entry
-                                })
-
-            # Sort attendance results by date
-            results = sorted(results, key=lambda x: x['date'], reverse=True)
+            # Attendance records by rank, newest first within a rank
+            rows, total = search_index.search_attendance(
+                query, page=page, per_page=per_page, limit=SEARCH_RESULT_LIMIT
+            )
+            for date, student_id in rows:
+                entry = attendance_index.entry(date, student_id)
+                if entry is not None:
+                    results.append({
+                        'date': date,
+                        'student_id': student_id,
+                        **entry
+                    })
 
     return render_template('search.html',
                            query=query,
                            search_type=search_type,
-                           results=results)
+                           results=results,
+                           page=page,
+                           per_page=per_page,
+                           total=total,
+                           pages=(total + per_page - 1) // per_page)
+def encode_cursor(date, student_id):
+    """Opaque position after the row (date, student_id)"""
+    raw = json.dumps([date, student_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, student_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(date, str) or not isinstance(student_id, str):
+        raise ValueError('Invalid cursor')
+    return date, student_id
+
+def attendance_query():
+    """Filters for AttendanceIndex.iter_records from the request's query string"""
+    filters = {
+        'start': request.args.get('start') or None,
+        'end': request.args.get('end') or None,
+        'department': request.args.get('department') or None,
+        'status': request.args.get('status') or None,
+        'student_id': request.args.get('student_id') or None,
+        'after': None,
+    }
+    for name in ('start', 'end'):
+        if filters[name] is not None:
+            try:
+                datetime.strptime(filters[name], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{name} must be YYYY-MM-DD')
+    if filters['status'] is not None and filters['status'] not in STATUS_CATEGORIES:
+        raise ValueError(f"status must be one of {', '.join(STATUS_CATEGORIES)}")
+    if request.args.get('cursor'):
+        filters['after'] = decode_cursor(request.args['cursor'])
+    return filters
+
+def attendance_rows(filters):
+    for date, student_id, entry in attendance_index.iter_records(**filters):
+        yield {'date': date, 'student_id': student_id, **entry}
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=API_CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header if nothing matched
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+@app.route('/api/v1/attendance')
+@app.route('/api/v1/attendance.<fmt>')
+def api_attendance(fmt='json'):
+    """Attendance rows, newest first, filtered by date range, department, status and student.
+
+    JSON returns one page and a ``next_cursor`` to pass back as ``cursor``.
+    NDJSON and CSV stream every matching row from the cursor on, one day of
+    the index at a time, so an export never builds the whole result.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    fmt = request.args.get('format', fmt)
+    if fmt not in ('json', 'ndjson', 'csv'):
+        return jsonify({'error': 'format must be json, ndjson or csv'}), 400
+    try:
+        filters = attendance_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if fmt == 'ndjson':
+        return Response(stream_with_context(ndjson_lines(attendance_rows(filters))),
+                        mimetype='application/x-ndjson')
+    if fmt == 'csv':
+        return Response(stream_with_context(csv_lines(attendance_rows(filters))),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=attendance.csv'})
+
+    limit = min(max(1, request.args.get('limit', API_PAGE_SIZE, type=int)), API_PAGE_LIMIT)
+    # One extra row tells whether there is a next page
+    rows = list(islice(attendance_rows(filters), limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['student_id'])
+    return jsonify({'data': rows, 'next_cursor': next_cursor})
+
 @app.route('/logout')
 def logout():
     session.pop('user_id', None)
@@ -509,7 +603,6 @@ def create_attendance_entry(student_id, status):
     user_data = load_user_data()
     if student_id in user_data:
         date_str = datetime.now().strftime("%Y-%m-%d")
-        filename = f"attendance_{date_str}.json"
 
         entry = {
             student_id: {
@@ -520,15 +613,8 @@ def create_attendance_entry(student_id, status):
             }
         }
 
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            data.setdefault(date_str, {}).update(entry)
-        else:
-            data = {date_str: entry}
-
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+        storage.merge_day(date_str, entry)
+        attendance_index.invalidate(date_str)
 
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -0,0 +1,236 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# One row per (date, student); every string column holds a code into that
+# column's dictionary, with -1 for a key the entry did not have
+ARCHIVE_DTYPE = np.dtype([
+    ("day", np.uint8),
+    ("student", np.int32),
+    ("name", np.int32),
+    ("department", np.int32),
+    ("status", np.int32),
+    ("time", np.int32),
+    ("extra", np.int32),
+])
+
+DICTIONARY_COLUMNS = ("student", "name", "department", "status", "extra")
+ENTRY_FIELDS = ("name", "department", "status")
+
+
+def parse_time(value):
+    """Seconds since midnight for a zero-padded "HH:MM:SS", or None if value has another form"""
+    try:
+        hours, minutes, seconds = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    total = hours * 3600 + minutes * 60 + seconds
+    # Anything that would not format back identically (e.g. "9:1:2") is kept as it is
+    if not 0 <= total < 86400 or format_time(total) != value:
+        return None
+    return total
+
+
+def format_time(seconds):
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Dictionary:
+    """Assigns consecutive integer codes to distinct strings"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def encode_month(days):
+    """Turn {date: {student_id: entry}} for one month into (rows, dictionaries)"""
+    dictionaries = {column: Dictionary() for column in DICTIONARY_COLUMNS}
+    rows = np.zeros(sum(len(entries) for entries in days.values()), dtype=ARCHIVE_DTYPE)
+
+    i = 0
+    for date in sorted(days):
+        day = int(date[8:10])
+        for student_id, entry in days[date].items():
+            extra = dict(entry)
+            row = rows[i]
+            row["day"] = day
+            row["student"] = dictionaries["student"].encode(student_id)
+            for field in ENTRY_FIELDS:
+                row[field] = dictionaries[field].encode(extra.pop(field)) if field in extra else -1
+
+            seconds = parse_time(extra.get("time"))
+            row["time"] = -1 if seconds is None else seconds
+            if seconds is not None:
+                del extra["time"]
+
+            # Anything else (timezone, odd time formats, ...) round-trips as JSON
+            row["extra"] = (
+                dictionaries["extra"].encode(json.dumps(extra, sort_keys=True)) if extra else -1
+            )
+            i += 1
+
+    return rows, {column: dictionary.values for column, dictionary in dictionaries.items()}
+
+
+def decode_rows(month, rows, dictionaries):
+    """Turn archive rows back into {date: {student_id: entry}}"""
+    days = {}
+    students = dictionaries["student"]
+    for row in rows.tolist():
+        day, student, name, department, status, seconds, extra = row
+        entry = {}
+        for field, code in zip(ENTRY_FIELDS, (name, department, status)):
+            if code >= 0:
+                entry[field] = dictionaries[field][code]
+        if seconds >= 0:
+            entry["time"] = format_time(seconds)
+        if extra >= 0:
+            entry.update(json.loads(dictionaries["extra"][extra]))
+        days.setdefault(f"{month}-{day:02d}", {})[students[student]] = entry
+    return days
+
+
+class MonthArchive:
+    """One month's rows and dictionaries, decoded on demand.
+
+    ``day_numbers`` lists every archived day, including days without marks;
+    archives written before it was stored fall back to the days with rows.
+    """
+
+    def __init__(self, month, rows, dictionaries, day_numbers=None):
+        self.month = month
+        self.rows = rows
+        self.dictionaries = dictionaries
+        if day_numbers is None:
+            day_numbers = np.unique(rows["day"])
+        self.day_numbers = sorted(int(day) for day in day_numbers)
+        self.days = None
+        self.student_codes = {student_id: code for code, student_id in enumerate(dictionaries["student"])}
+
+    def dates(self):
+        return [f"{self.month}-{day:02d}" for day in self.day_numbers]
+
+    def load_days(self):
+        if self.days is None:
+            days = decode_rows(self.month, self.rows, self.dictionaries)
+            self.days = {date: days.get(date, {}) for date in self.dates()}
+        return self.days
+
+    def student_rows(self, student_id):
+        """{date: entry} for one student, found by scanning one integer column"""
+        code = self.student_codes.get(student_id)
+        if code is None:
+            return {}
+        rows = self.rows[self.rows["student"] == code]
+        return {
+            date: entries[student_id]
+            for date, entries in decode_rows(self.month, rows, self.dictionaries).items()
+        }
+
+
+class AttendanceArchive:
+    """Columnar per-month store for closed attendance days.
+
+    Each ``attendance_<YYYY-MM>.npz`` holds a NumPy structured array with
+    one row per mark, dictionaries for student ids, names, departments,
+    statuses and any remaining fields, and the list of archived days (some
+    of which may have no marks), so a month is a single small file
+    that loads without JSON parsing. Loaded months are cached until their
+    file changes.
+    """
+
+    def __init__(self, directory="attendance_archive"):
+        self.directory = directory
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def path(self, month):
+        return os.path.join(self.directory, f"attendance_{month}.npz")
+
+    def months(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name[len("attendance_"):-len(".npz")]
+            for name in names
+            if name.startswith("attendance_") and name.endswith(".npz")
+        )
+
+    def load(self, month):
+        """Return the MonthArchive for a month, or None if it was never archived"""
+        path = self.path(month)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            cached = self.cache.get(month)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
+
+        with np.load(path, allow_pickle=False) as data:
+            archive = MonthArchive(
+                month,
+                data["rows"],
+                {column: data[column].tolist() for column in DICTIONARY_COLUMNS},
+                data["days"] if "days" in data.files else None,
+            )
+        with self.lock:
+            self.cache[month] = (mtime_ns, archive)
+        return archive
+
+    def dates(self):
+        dates = []
+        for month in self.months():
+            dates.extend(self.load(month).dates())
+        return dates
+
+    def load_day(self, date):
+        """Return a copy of {student_id: entry} for an archived date ({} if absent)"""
+        archive = self.load(date[:7])
+        if archive is None:
+            return {}
+        entries = archive.load_days().get(date, {})
+        return {student_id: dict(entry) for student_id, entry in entries.items()}
+
+    def write_month(self, month, days):
+        """Replace a month's archive with days, atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        rows, dictionaries = encode_month(days)
+        arrays = {
+            column: np.array(values, dtype=str) if values else np.array([], dtype="<U1")
+            for column, values in dictionaries.items()
+        }
+        # Kept apart from the rows so days without any marks stay archived
+        arrays["days"] = np.array(sorted(int(date[8:10]) for date in days), dtype=np.uint8)
+
+        path = self.path(month)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, rows=rows, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+
+if __name__ == "__main__":
+    from attendance_storage import JsonStorage
+
+    today = sys.argv[1] if len(sys.argv) > 1 else datetime.now().strftime("%Y-%m-%d")
+    months, days = JsonStorage().archive_closed_days(today)
+    print(f"Archived {days} day(s) into {months} monthly archive(s)")
@@ -0,0 +1,513 @@
+import bisect
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import date as Date, timedelta
+
+from attendance_storage import STATUS_CATEGORIES, is_late, status_category
+
+# Columns of a rollup row: marks, then marks per status category
+ROLLUP_FIELDS = ("present",) + STATUS_CATEGORIES
+
+
+class StudentAggregate:
+    """One student's attendance totals, kept current as marks are indexed.
+
+    Holds present and late counts overall and per month, the current streak
+    (consecutive calendar days ending at the last attendance), the longest
+    streak, the last attendance and the ``recent_size`` newest records.
+    A mark on a new latest date is applied in O(1); anything else (an edit,
+    a deletion, a back-dated mark) rebuilds the student from their postings.
+    """
+
+    def __init__(self, recent_size=5):
+        self.months = defaultdict(lambda: [0, 0])
+        self.present = 0
+        self.late = 0
+        self.current_streak = 0
+        self.max_streak = 0
+        self.last_date = None
+        self.last_ordinal = None
+        self.last_entry = None
+        self.recent = deque(maxlen=recent_size)
+
+    def append(self, date, entry):
+        """Count a mark on a date later than every date counted so far"""
+        month = self.months[date[:7]]
+        if is_late(entry):
+            self.late += 1
+            month[1] += 1
+        else:
+            self.present += 1
+            month[0] += 1
+
+        ordinal = Date.fromisoformat(date).toordinal()
+        if self.last_date is not None and ordinal - self.last_ordinal == 1:
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.max_streak = max(self.max_streak, self.current_streak)
+
+        self.last_date = date
+        self.last_ordinal = ordinal
+        self.last_entry = entry
+        self.recent.appendleft((date, entry))
+
+    @classmethod
+    def build(cls, postings, recent_size=5):
+        aggregate = cls(recent_size)
+        for date in sorted(postings):
+            aggregate.append(date, postings[date])
+        return aggregate
+
+    @property
+    def total(self):
+        return self.present + self.late
+
+
+class AttendanceIndex:
+    """Process-wide in-memory index over every attendance day.
+
+    Built once from the storage, then kept current by polling: at most every
+    ``refresh_interval`` seconds a query compares each date's signature
+    (file mtime and size, or row count and rowid in SQLite) with the one it
+    indexed and reloads only the dates that changed. ``invalidate`` forces a
+    date to be reloaded on the next query, for writes made by this process.
+
+    Alongside the days themselves it keeps postings per student
+    ({student_id: {date: entry}}) and per department
+    ({department: {date: {student_id}}}), running totals, a rollup of
+    present/on-time/grace/late counts per date and department, and a
+    StudentAggregate per student. A reloaded day is diffed against the
+    indexed one, so only the students whose entry changed are touched.
+    """
+
+    def __init__(self, storage, refresh_interval=2.0, recent_size=5):
+        self.storage = storage
+        self.refresh_interval = refresh_interval
+        self.recent_size = recent_size
+        self.lock = threading.RLock()
+        self.signatures = {}
+        self.days = {}
+        self.by_student = defaultdict(dict)
+        self.by_department = defaultdict(lambda: defaultdict(set))
+        self.department_totals = defaultdict(int)
+        self.rollups = defaultdict(dict)
+        self.aggregates = {}
+        self.month_dates = defaultdict(int)
+        self.total_lates = 0
+        self.sorted_dates = []
+        self.last_refresh = None
+        self.invalidated = set()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(date, student_id, old_entry, new_entry) for every indexed change"""
+        with self.lock:
+            self.listeners.append(listener)
+
+    # Maintenance
+
+    def _rollup_fields(self, entry):
+        """Positions in a rollup row that one entry counts towards"""
+        category = status_category(entry)
+        if category is None:
+            return (0,)
+        return (0, ROLLUP_FIELDS.index(category))
+
+    def _remove_posting(self, date, student_id, entry):
+        del self.by_student[student_id][date]
+        if not self.by_student[student_id]:
+            del self.by_student[student_id]
+
+        department = entry.get("department", "Unknown")
+        postings = self.by_department[department]
+        postings[date].discard(student_id)
+        if not postings[date]:
+            del postings[date]
+        self.department_totals[department] -= 1
+        if not self.department_totals[department]:
+            del self.department_totals[department]
+            del self.by_department[department]
+
+        counts = self.rollups[date][department]
+        for field in self._rollup_fields(entry):
+            counts[field] -= 1
+        if not counts[0]:
+            del self.rollups[date][department]
+            if not self.rollups[date]:
+                del self.rollups[date]
+
+        if is_late(entry):
+            self.total_lates -= 1
+
+        for listener in self.listeners:
+            listener(date, student_id, entry, None)
+
+    def _add_posting(self, date, student_id, entry):
+        self.by_student[student_id][date] = entry
+
+        department = entry.get("department", "Unknown")
+        self.by_department[department][date].add(student_id)
+        self.department_totals[department] += 1
+
+        counts = self.rollups[date].get(department)
+        if counts is None:
+            counts = self.rollups[date][department] = [0] * len(ROLLUP_FIELDS)
+        for field in self._rollup_fields(entry):
+            counts[field] += 1
+
+        if is_late(entry):
+            self.total_lates += 1
+
+        for listener in self.listeners:
+            listener(date, student_id, None, entry)
+
+    def _update_day(self, date, entries):
+        """Index a date's new entries (None if the date is gone); returns the students touched"""
+        old = self.days.get(date, {})
+        if entries is None:
+            if date in self.days:
+                del self.days[date]
+                self.month_dates[date[:7]] -= 1
+            entries = {}
+        else:
+            if date not in self.days:
+                self.month_dates[date[:7]] += 1
+            self.days[date] = entries
+
+        rebuild = set()
+        appended = []
+        for student_id, entry in old.items():
+            if entries.get(student_id) != entry:
+                self._remove_posting(date, student_id, entry)
+                rebuild.add(student_id)
+        for student_id, entry in entries.items():
+            if old.get(student_id) != entry:
+                self._add_posting(date, student_id, entry)
+                appended.append(student_id)
+
+        for student_id in appended:
+            aggregate = self.aggregates.get(student_id)
+            if student_id in rebuild or aggregate is None or aggregate.last_date >= date:
+                rebuild.add(student_id)
+            else:
+                aggregate.append(date, entries[student_id])
+
+        for student_id in rebuild:
+            postings = self.by_student.get(student_id)
+            if postings:
+                self.aggregates[student_id] = StudentAggregate.build(postings, self.recent_size)
+            else:
+                self.aggregates.pop(student_id, None)
+
+    def refresh(self, force=False):
+        """Reload every date whose signature changed since it was indexed"""
+        with self.lock:
+            now = time.monotonic()
+            if (not force and not self.invalidated and self.last_refresh is not None
+                    and now - self.last_refresh < self.refresh_interval):
+                return
+            self.last_refresh = now
+
+            signatures = self.storage.day_signatures()
+            changed = [
+                date for date, signature in signatures.items()
+                if self.signatures.get(date) != signature or date in self.invalidated
+            ]
+            removed = [date for date in self.signatures if date not in signatures]
+            self.invalidated.clear()
+            if not changed and not removed:
+                return
+
+            for date in removed:
+                self._update_day(date, None)
+            # Oldest first, so an initial build appends each student's marks in order
+            for date in sorted(changed):
+                self._update_day(date, self.storage.load_day(date))
+
+            self.signatures = signatures
+            self.sorted_dates = sorted(self.days)
+
+    def invalidate(self, date):
+        with self.lock:
+            self.invalidated.add(date)
+
+    # Queries
+
+    def dates(self):
+        """Every date with attendance, oldest first"""
+        self.refresh()
+        with self.lock:
+            return list(self.sorted_dates)
+
+    def entry(self, date, student_id):
+        """One student's entry on a date, or None"""
+        self.refresh()
+        with self.lock:
+            entry = self.days.get(date, {}).get(student_id)
+            return dict(entry) if entry is not None else None
+
+    def day(self, date):
+        self.refresh()
+        with self.lock:
+            return {student_id: dict(entry) for student_id, entry in self.days.get(date, {}).items()}
+
+    def student_records(self, student_id):
+        """[(date, entry)] for one student, newest first"""
+        self.refresh()
+        with self.lock:
+            postings = self.by_student.get(student_id, {})
+            return [(date, dict(postings[date])) for date in sorted(postings, reverse=True)]
+
+    def count_lates(self, student_id):
+        self.refresh()
+        with self.lock:
+            aggregate = self.aggregates.get(student_id)
+            return aggregate.late if aggregate else 0
+
+    def student_summary(self, student_id):
+        """Materialised totals for one student, without touching their history.
+
+        Months cover every month with indexed attendance; a student is
+        absent on an indexed date of a month they did not attend.
+        """
+        self.refresh()
+        with self.lock:
+            aggregate = self.aggregates.get(student_id) or StudentAggregate(self.recent_size)
+            months = {}
+            for month, dates in sorted(self.month_dates.items()):
+                if not dates:
+                    continue
+                present, late = aggregate.months.get(month, (0, 0))
+                months[month] = {
+                    "present": present,
+                    "late": late,
+                    "absent": dates - present - late,
+                }
+            last = None
+            if aggregate.last_date is not None:
+                last = {"date": aggregate.last_date, **aggregate.last_entry}
+            return {
+                "total_days": aggregate.total,
+                "present_days": aggregate.present,
+                "late_days": aggregate.late,
+                "current_streak": aggregate.current_streak,
+                "max_streak": aggregate.max_streak,
+                "last_attendance": last,
+                "recent_records": [{"date": date, **entry} for date, entry in aggregate.recent],
+                "months": months,
+            }
+
+    def late_counts(self, start=None, end=None):
+        """{student_id: late marks} for every student in one pass.
+
+        Without a window this copies the maintained counters; with ``start``
+        and/or ``end`` (inclusive dates) it scans only the days in range.
+        """
+        self.refresh()
+        with self.lock:
+            if start is None and end is None:
+                return {
+                    student_id: aggregate.late
+                    for student_id, aggregate in self.aggregates.items()
+                    if aggregate.late
+                }
+
+            dates = self.sorted_dates
+            low = bisect.bisect_left(dates, start) if start else 0
+            high = bisect.bisect_right(dates, end) if end else len(dates)
+            counts = defaultdict(int)
+            for date in dates[low:high]:
+                for student_id, entry in self.days[date].items():
+                    if is_late(entry):
+                        counts[student_id] += 1
+            return dict(counts)
+
+    def late_warnings(self, threshold=3, start=None, end=None):
+        """[(student_id, late marks)] at or over threshold within the window, most first"""
+        counts = self.late_counts(start, end)
+        return sorted(
+            ((student_id, count) for student_id, count in counts.items() if count >= threshold),
+            key=lambda item: (-item[1], item[0]),
+        )
+
+    def late_total(self):
+        self.refresh()
+        with self.lock:
+            return self.total_lates
+
+    def department_counts(self):
+        """{department: number of marks}"""
+        self.refresh()
+        with self.lock:
+            return dict(self.department_totals)
+
+    def iter_records(self, start=None, end=None, department=None, status=None,
+                     student_id=None, after=None):
+        """Yield (date, student_id, entry) newest date first, then by student id.
+
+        Filters are optional: an inclusive date range, a department, a
+        status category ("on_time", "grace" or "late") and a student.
+        ``after`` is a (date, student_id) position to resume after. The
+        lock is held for one date at a time, so a long stream neither
+        blocks writers nor copies more than a day.
+        """
+        self.refresh()
+        with self.lock:
+            dates = self.sorted_dates
+            low = bisect.bisect_left(dates, start) if start else 0
+            high = bisect.bisect_right(dates, end) if end else len(dates)
+            if after is not None:
+                high = min(high, bisect.bisect_right(dates, after[0]))
+            dates = dates[low:high]
+
+        for date in reversed(dates):
+            with self.lock:
+                if student_id is not None:
+                    candidates = [student_id] if date in self.by_student.get(student_id, ()) else []
+                elif department is not None:
+                    candidates = sorted(self.by_department.get(department, {}).get(date, ()))
+                else:
+                    candidates = sorted(self.days.get(date, ()))
+                if after is not None and date == after[0]:
+                    candidates = candidates[bisect.bisect_right(candidates, after[1]):]
+
+                rows = []
+                for candidate in candidates:
+                    entry = self.days.get(date, {}).get(candidate)
+                    if entry is None:
+                        continue
+                    if department is not None and entry.get("department", "Unknown") != department:
+                        continue
+                    if status is not None and status_category(entry) != status:
+                        continue
+                    rows.append((date, candidate, dict(entry)))
+            yield from rows
+
+    def daily_rollup(self, last=None):
+        """[(date, {department: {field: count}})] oldest first, for the last ``last`` dates.
+
+        Fields are ROLLUP_FIELDS. Read straight from the rollup, so the cost
+        depends only on ``last`` and the number of departments.
+        """
+        self.refresh()
+        with self.lock:
+            dates = self.sorted_dates[-last:] if last else self.sorted_dates
+            return [
+                (date, {
+                    department: dict(zip(ROLLUP_FIELDS, counts))
+                    for department, counts in self.rollups[date].items()
+                })
+                for date in dates
+            ]
+
+
+class _SyntheticStorage:
+    """Just enough of the storage interface to index generated data"""
+
+    def __init__(self, students, days, late_rate, departments=("IT", "Chemistry", "English", "Microbiology")):
+        rng = random.Random(0)
+        first = Date(2000, 1, 1)
+        templates = {
+            (department, late): {
+                "name": "Student",
+                "department": department,
+                "time": "09:20:00" if late else "08:55:00",
+                "status": "Late by 20 minutes" if late else "On Time",
+            }
+            for department in departments
+            for late in (False, True)
+        }
+        # Entries are shared between rows; the index only reads them
+        self.days = {
+            (first + timedelta(days=day)).isoformat(): {
+                str(student).zfill(6): templates[
+                    (departments[student % len(departments)], rng.random() < late_rate)
+                ]
+                for student in range(students)
+            }
+            for day in range(days)
+        }
+
+    def day_signatures(self):
+        return {date: 0 for date in self.days}
+
+    def load_day(self, date):
+        return self.days[date]
+
+
+def benchmark_warnings(students=10000, days=365, late_rate=0.05, window_days=30, repeats=5):
+    """Time the /warnings aggregation at students x days.
+
+    Compares the per-student loop the route used to run (one history scan
+    per student, here over memory rather than disk) with the one-pass
+    batch, both over all time and over the last ``window_days`` days.
+    """
+    storage = _SyntheticStorage(students, days, late_rate)
+    index = AttendanceIndex(storage)
+
+    start = time.perf_counter()
+    index.refresh(force=True)
+    build = time.perf_counter() - start
+
+    def timed(function):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    # The old route: every student scans every day
+    sample = [str(student).zfill(6) for student in range(0, students, max(1, students // 100))]
+    sample_time, _ = timed(lambda: [
+        sum(1 for entries in storage.days.values() if student_id in entries and is_late(entries[student_id]))
+        for student_id in sample
+    ])
+    per_student = sample_time / len(sample) * students
+
+    all_time, warnings = timed(lambda: index.late_warnings(3))
+    window_start = index.dates()[-window_days]
+    windowed, windowed_warnings = timed(lambda: index.late_warnings(3, start=window_start))
+    return {
+        "build_s": build,
+        "per_student_scan_ms": 1000.0 * per_student,
+        "batch_all_time_ms": 1000.0 * all_time,
+        "batch_window_ms": 1000.0 * windowed,
+        "warnings_all_time": len(warnings),
+        "warnings_window": len(windowed_warnings),
+    }
+
+
+def benchmark_dashboard(students=1000, histories=(30, 365, 1825), repeats=20):
+    """Latency of the /dashboard rollup read as the amount of history grows"""
+    results = {}
+    for days in histories:
+        index = AttendanceIndex(_SyntheticStorage(students, days, 0.05))
+        index.refresh(force=True)
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            index.daily_rollup(last=7)
+            index.department_counts()
+            index.late_total()
+            best = min(best, time.perf_counter() - start)
+        results[days] = 1000.0 * best
+    return results
+
+
+if __name__ == "__main__":
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    results = benchmark_warnings(students, days)
+    print(f"{students} students x {days} days (index built in {results['build_s']:.1f}s)")
+    print(f"per-student scan (old route, extrapolated): {results['per_student_scan_ms']:10.1f} ms")
+    print(f"batch late counts, all time:                {results['batch_all_time_ms']:10.1f} ms "
+          f"({results['warnings_all_time']} warnings)")
+    print(f"batch late counts, last 30 days:            {results['batch_window_ms']:10.1f} ms "
+          f"({results['warnings_window']} warnings)")
+    for days, latency in benchmark_dashboard().items():
+        print(f"dashboard rollup, {days:5d} days of history:   {latency:10.3f} ms")
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+from datetime import datetime
+from functools import partial
+
+
+def write_json_atomic(path, data, indent=4):
+    """Write JSON to a temporary file, fsync it and rename it over path"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def apply_operation(entries, operation):
+    """Apply one journal operation to a day's {user_id: record} dict"""
+    op = operation.get("op")
+    if op == "mark":
+        entries[operation["id"]] = operation["record"]
+    elif op == "delete":
+        entries.pop(operation["id"], None)
+    elif op == "clear":
+        entries.clear()
+
+
+class AttendanceJournal:
+    """Append-only, fsync-batched log of attendance changes.
+
+    Every mark, delete or clear is appended as one JSON line to
+    ``journal_<date>.jsonl`` instead of rewriting the day's file. Each batch
+    of lines is written with one write and fsynced once. ``compact`` folds the
+    journal into the day's snapshot in the attendance storage (the
+    ``attendance_<date>.json`` file by default) and truncates it (or, for a
+    date before today, deletes it), so
+    recovery after a crash only has to replay the short tail. Compaction
+    replays onto the snapshot as it is stored at that moment, under the
+    storage's lock, so entries written by other processes are kept.
+    Operations are idempotent, so a crash between writing the snapshot and
+    truncating the journal is harmless.
+    """
+
+    def __init__(self, storage, directory="attendance_journal"):
+        self.storage = storage
+        self.directory = directory
+        self.files = {}
+        self.lines = {}
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, date):
+        return os.path.join(self.directory, f"journal_{date}.jsonl")
+
+    def _file(self, date):
+        f = self.files.get(date)
+        if f is None:
+            f = self.files[date] = open(self.path(date), "a")
+        return f
+
+    def extend(self, date, operations):
+        """Append a batch of operations for a date with one write and one fsync"""
+        if not operations:
+            return
+        with self.lock:
+            f = self._file(date)
+            f.write("".join(json.dumps(operation) + "\n" for operation in operations))
+            f.flush()
+            self.lines[date] = self.lines.get(date, 0) + len(operations)
+            self._sync()
+
+    def _sync(self):
+        for f in self.files.values():
+            os.fsync(f.fileno())
+
+    def sync(self):
+        """Force every pending line to disk"""
+        with self.lock:
+            self._sync()
+
+    def pending(self, date):
+        """Number of journal lines appended for a date since the last compaction"""
+        return self.lines.get(date, 0)
+
+    def dates(self):
+        """Dates whose journal still holds lines that are not in the snapshot"""
+        dates = set(date for date, lines in self.lines.items() if lines)
+        for name in os.listdir(self.directory):
+            if (name.startswith("journal_") and name.endswith(".jsonl")
+                    and os.path.getsize(os.path.join(self.directory, name))):
+                dates.add(name[len("journal_"):-len(".jsonl")])
+        return sorted(dates)
+
+    def replay(self, date, entries):
+        """Apply the journal tail for a date onto entries, ignoring a torn last line"""
+        replayed = 0
+        try:
+            with open(self.path(date), "r") as f:
+                for line in f:
+                    try:
+                        apply_operation(entries, json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        # Recovered lines still need folding into the snapshot
+        with self.lock:
+            self.lines[date] = max(self.lines.get(date, 0), replayed)
+        return entries
+
+    def load_day(self, date):
+        """Return {date: entries} from the stored snapshot plus the journal tail"""
+        entries = self.storage.load_day(date)
+        self.replay(date, entries)
+        return {date: entries}
+
+    def compact(self, date):
+        """Fold the journal into the stored snapshot for date and empty it; returns the day"""
+        with self.lock:
+            entries = self.storage.update_day(date, partial(self.replay, date))
+
+            f = self.files.pop(date, None)
+            if f is not None:
+                f.close()
+            if date < datetime.now().strftime("%Y-%m-%d"):
+                # Past days get no more marks, so their journal can go entirely
+                try:
+                    os.remove(self.path(date))
+                except FileNotFoundError:
+                    pass
+                self.lines.pop(date, None)
+            else:
+                open(self.path(date), "w").close()
+                self.lines[date] = 0
+            return entries
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            for f in self.files.values():
+                f.close()
+            self.files = {}
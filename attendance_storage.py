@@ -0,0 +1,453 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import ExitStack
+
+from attendance_archive import AttendanceArchive
+from attendance_journal import write_json_atomic
+from attendance_writer import file_lock
+
+USERS_FILE = "user_records.json"
+SETTINGS_FILE = "settings.json"
+STATUS_CATEGORIES = ("on_time", "grace", "late")
+
+
+def is_late(entry):
+    return "Late" in entry.get("status", "")
+
+
+def status_category(entry):
+    """"on_time", "grace" or "late" for the statuses mark_attendance writes, else None"""
+    status = entry.get("status", "")
+    if "Late" in status:
+        return "late"
+    if status == "On Time":
+        return "on_time"
+    if "Grace" in status:
+        return "grace"
+    return None
+
+
+class JsonStorage:
+    """The original layout: user_records.json plus one attendance_<date>.json per day.
+
+    Closed days can be rolled into a columnar monthly archive with
+    ``archive_closed_days``; every reader below sees archived and live days
+    alike, and a live file takes precedence over the archive for its date.
+    """
+
+    name = "json"
+
+    def __init__(self, directory=".", users_file=USERS_FILE):
+        self.directory = directory
+        self.users_path = os.path.join(directory, users_file)
+        self.archive = AttendanceArchive(os.path.join(directory, "attendance_archive"))
+
+    # Users
+
+    def load_users(self):
+        try:
+            with open(self.users_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def users_signature(self):
+        """Changes whenever user_records.json may have changed"""
+        try:
+            stat = os.stat(self.users_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def save_users(self, users):
+        with file_lock(self.users_path):
+            write_json_atomic(self.users_path, users)
+
+    def save_user(self, student_id, info):
+        with file_lock(self.users_path):
+            users = self.load_users()
+            users[student_id] = info
+            write_json_atomic(self.users_path, users)
+
+    # Attendance
+
+    def day_path(self, date):
+        return os.path.join(self.directory, f"attendance_{date}.json")
+
+    def live_dates(self):
+        """Dates that have an attendance file, oldest first"""
+        return sorted(
+            f[len("attendance_"):-len(".json")]
+            for f in os.listdir(self.directory)
+            if f.startswith("attendance_") and f.endswith(".json")
+        )
+
+    def attendance_dates(self):
+        """Dates with attendance, live or archived, oldest first"""
+        return sorted(set(self.live_dates()) | set(self.archive.dates()))
+
+    def day_signatures(self):
+        """{date: signature} that changes whenever a date's attendance may have changed"""
+        signatures = {}
+        for month in self.archive.months():
+            mtime_ns = os.stat(self.archive.path(month)).st_mtime_ns
+            for date in self.archive.load(month).dates():
+                signatures[date] = ("archive", mtime_ns)
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("attendance_") and name.endswith(".json"):
+                    stat = entry.stat()
+                    signatures[name[len("attendance_"):-len(".json")]] = (
+                        stat.st_mtime_ns, stat.st_size
+                    )
+        return signatures
+
+    def _read_file(self, date):
+        try:
+            with open(self.day_path(date), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Archived days are edited by writing a live file for them again
+            return {date: self.archive.load_day(date)}
+        except json.JSONDecodeError:
+            return {}
+
+    def load_day(self, date):
+        """Return {student_id: entry} for one date"""
+        return self._read_file(date).get(date, {})
+
+    def replace_day(self, date, entries):
+        """Overwrite one date's attendance with entries"""
+        with file_lock(self.day_path(date)):
+            write_json_atomic(self.day_path(date), {date: entries})
+
+    def update_day(self, date, update):
+        """Apply update(entries) to a date's {student_id: entry} under the day's lock"""
+        path = self.day_path(date)
+        with file_lock(path):
+            data = self._read_file(date)
+            entries = data.setdefault(date, {})
+            update(entries)
+            write_json_atomic(path, data)
+            return entries
+
+    def merge_day(self, date, marks=None, deletes=(), clear=False):
+        """Apply marks ({student_id: entry}) and deletions to a date; returns the merged day"""
+        def update(entries):
+            if clear:
+                entries.clear()
+            for student_id in deletes:
+                entries.pop(student_id, None)
+            entries.update(marks or {})
+
+        return self.update_day(date, update)
+
+    def iter_days(self, start=None, end=None, reverse=False):
+        """Yield (date, {student_id: entry}) for every stored date in [start, end]"""
+        dates = self.attendance_dates()
+        for date in reversed(dates) if reverse else dates:
+            if (start and date < start) or (end and date > end):
+                continue
+            yield date, self.load_day(date)
+
+    def student_records(self, student_id):
+        """Return [(date, entry)] for one student, newest first"""
+        live_dates = self.live_dates()
+        records = {}
+        for month in self.archive.months():
+            records.update(self.archive.load(month).student_rows(student_id))
+        for date in live_dates:
+            records.pop(date, None)
+            entries = self.load_day(date)
+            if student_id in entries:
+                records[date] = entries[student_id]
+        return sorted(records.items(), reverse=True)
+
+    def count_lates(self, student_id):
+        return sum(1 for _, entry in self.student_records(student_id) if is_late(entry))
+
+    def archive_closed_days(self, today):
+        """Roll every live day before today into its month's archive and remove the files.
+
+        Returns (months, days) archived. Each month is rewritten with its
+        previously archived days plus the newly closed ones, while holding
+        the locks of the day files being folded in.
+        """
+        closed = {}
+        for date in self.live_dates():
+            if date < today:
+                closed.setdefault(date[:7], []).append(date)
+
+        for month, dates in closed.items():
+            with ExitStack() as stack:
+                for date in dates:
+                    stack.enter_context(file_lock(self.day_path(date)))
+
+                archived = self.archive.load(month)
+                days = dict(archived.load_days()) if archived is not None else {}
+                for date in dates:
+                    days[date] = self.load_day(date)
+                self.archive.write_month(month, days)
+
+                for date in dates:
+                    os.remove(self.day_path(date))
+        return len(closed), sum(len(dates) for dates in closed.values())
+
+
+class SqliteStorage:
+    """Users and attendance in one SQLite database in WAL mode.
+
+    Attendance rows are keyed by (date, student_id) and additionally indexed
+    by student, department and status, so per-student and per-department
+    queries no longer parse every day. The full JSON of each user and entry
+    is kept in a ``data`` column so records round-trip unchanged.
+
+    Every write also bumps a counter in ``versions``, one for the users and
+    one per attendance date. Row counts and rowids alone can repeat after a
+    rewrite, so the change signatures use the counter, and polling a date's
+    signature reads one small row rather than its attendance rows.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            student_id TEXT PRIMARY KEY,
+            name TEXT,
+            department TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS users_department ON users (department);
+
+        CREATE TABLE IF NOT EXISTS attendance (
+            date TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            name TEXT,
+            department TEXT,
+            time TEXT,
+            status TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (date, student_id)
+        );
+        CREATE INDEX IF NOT EXISTS attendance_student ON attendance (student_id, date);
+        CREATE INDEX IF NOT EXISTS attendance_department ON attendance (department, date);
+        CREATE INDEX IF NOT EXISTS attendance_status ON attendance (status);
+
+        -- Bumped on every write: key is "users" or an attendance date
+        CREATE TABLE IF NOT EXISTS versions (
+            key TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path="attendance.db"):
+        self.path = path
+        self.local = threading.local()
+        self.connection.executescript(self.SCHEMA)
+        with self.connection as connection:
+            # Databases from before the versions table: give every date a version
+            connection.execute(
+                "INSERT OR IGNORE INTO versions SELECT DISTINCT date, 0 FROM attendance"
+            )
+
+    @property
+    def connection(self):
+        # sqlite3 connections may not be shared between threads
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def _bump_version(self, connection, key):
+        connection.execute("INSERT OR IGNORE INTO versions VALUES (?, 0)", (key,))
+        connection.execute("UPDATE versions SET version = version + 1 WHERE key = ?", (key,))
+
+    # Users
+
+    def load_users(self):
+        rows = self.connection.execute("SELECT student_id, data FROM users")
+        return {student_id: json.loads(data) for student_id, data in rows}
+
+    def users_signature(self):
+        return self.connection.execute(
+            """SELECT COUNT(*), MAX(rowid),
+                      (SELECT version FROM versions WHERE key = 'users')
+               FROM users"""
+        ).fetchone()
+
+    def _user_row(self, student_id, info):
+        return (student_id, info.get("name"), info.get("department"), json.dumps(info))
+
+    def save_users(self, users):
+        with self.connection as connection:
+            connection.execute("DELETE FROM users")
+            connection.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?)",
+                [self._user_row(student_id, info) for student_id, info in users.items()],
+            )
+            self._bump_version(connection, "users")
+
+    def save_user(self, student_id, info):
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)",
+                self._user_row(student_id, info),
+            )
+            self._bump_version(connection, "users")
+
+    # Attendance
+
+    def _entry_row(self, date, student_id, entry):
+        return (
+            date, student_id, entry.get("name"), entry.get("department"),
+            entry.get("time"), entry.get("status"), json.dumps(entry),
+        )
+
+    def attendance_dates(self):
+        # Every written date has a version row, including days whose marks were all removed
+        rows = self.connection.execute("SELECT key FROM versions WHERE key != 'users' ORDER BY key")
+        return [date for date, in rows]
+
+    def day_signatures(self):
+        # One small row per date, so polling does not scan the attendance rows
+        rows = self.connection.execute("SELECT key, version FROM versions WHERE key != 'users'")
+        return dict(rows.fetchall())
+
+    def load_day(self, date):
+        rows = self.connection.execute(
+            "SELECT student_id, data FROM attendance WHERE date = ?", (date,)
+        )
+        return {student_id: json.loads(data) for student_id, data in rows}
+
+    def replace_day(self, date, entries):
+        self.merge_day(date, entries, clear=True)
+
+    def _write_day(self, connection, date, marks, deletes=(), clear=False):
+        if clear:
+            connection.execute("DELETE FROM attendance WHERE date = ?", (date,))
+        connection.executemany(
+            "DELETE FROM attendance WHERE date = ? AND student_id = ?",
+            [(date, student_id) for student_id in deletes],
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO attendance VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._entry_row(date, student_id, entry) for student_id, entry in marks.items()],
+        )
+        self._bump_version(connection, date)
+
+    def update_day(self, date, update):
+        # BEGIN IMMEDIATE takes the write lock before the read, so no other
+        # writer can slip in between reading the day and writing it back
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            entries = self.load_day(date)
+            update(entries)
+            self._write_day(connection, date, entries, clear=True)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return entries
+
+    def merge_day(self, date, marks=None, deletes=(), clear=False):
+        with self.connection as connection:
+            self._write_day(connection, date, marks or {}, deletes, clear)
+        return self.load_day(date)
+
+    def iter_days(self, start=None, end=None, reverse=False):
+        rows = self.connection.execute(
+            f"""SELECT versions.key, attendance.student_id, attendance.data FROM versions
+                LEFT JOIN attendance ON attendance.date = versions.key
+                WHERE versions.key != 'users' AND versions.key >= ? AND versions.key <= ?
+                ORDER BY versions.key {'DESC' if reverse else 'ASC'}""",
+            (start or "", end or "9999-99-99"),
+        )
+        current_date, entries = None, {}
+        for date, student_id, data in rows:
+            if date != current_date:
+                if current_date is not None:
+                    yield current_date, entries
+                current_date, entries = date, {}
+            if student_id is not None:
+                entries[student_id] = json.loads(data)
+        if current_date is not None:
+            yield current_date, entries
+
+    def student_records(self, student_id):
+        rows = self.connection.execute(
+            "SELECT date, data FROM attendance WHERE student_id = ? ORDER BY date DESC",
+            (student_id,),
+        )
+        return [(date, json.loads(data)) for date, data in rows]
+
+    def count_lates(self, student_id):
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM attendance WHERE student_id = ? AND status LIKE '%Late%'",
+            (student_id,),
+        ).fetchone()
+        return count
+
+    def archive_closed_days(self, today):
+        # Rows are already indexed by date; there is nothing to roll up
+        return 0, 0
+
+
+def load_settings(settings_file=SETTINGS_FILE):
+    try:
+        with open(settings_file, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_storage_settings(settings_file=SETTINGS_FILE):
+    settings = load_settings(settings_file)
+    return settings.get("storage_backend", "json"), settings.get("database_path", "attendance.db")
+
+
+def open_storage(backend=None, database_path=None):
+    """Open the storage backend selected in settings.json (JSON files by default)"""
+    configured_backend, configured_path = load_storage_settings()
+    backend = backend or configured_backend
+    if backend == SqliteStorage.name:
+        return SqliteStorage(database_path or configured_path)
+    if backend == JsonStorage.name:
+        return JsonStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def migrate_json_to_sqlite(database_path="attendance.db", source=None):
+    """Copy every user and attendance record from the JSON files into SQLite"""
+    source = source or JsonStorage()
+    target = SqliteStorage(database_path)
+
+    users = source.load_users()
+    target.save_users(users)
+
+    days = 0
+    entries = 0
+    for date, day in source.iter_days():
+        # replace_day records the date even when the day has no marks left
+        target.replace_day(date, day)
+        days += 1
+        entries += len(day)
+    return len(users), days, entries
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python attendance_storage.py migrate [database_path]")
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else "attendance.db"
+    users, days, entries = migrate_json_to_sqlite(path)
+    print(f"Migrated {users} users and {entries} attendance entries over {days} days into {path}")
+    print('Set "storage_backend": "sqlite" in settings.json to use it.')
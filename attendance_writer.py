@@ -0,0 +1,373 @@
+import multiprocessing as mp
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+def _try_lock(f):
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path, timeout=10.0, poll_interval=0.005):
+    """Hold an exclusive lock for ``path`` across threads and processes.
+
+    Every read-modify-write of a shared attendance or user file, whether it
+    comes from the desktop app or the web app, goes through this lock so
+    that neither can overwrite changes the other made in between. Lock files
+    live in a ``.locks`` directory next to the file and are never removed,
+    so every process always locks the same inode.
+    """
+    directory, name = os.path.split(path)
+    lock_directory = os.path.join(directory, ".locks")
+    os.makedirs(lock_directory, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    with open(os.path.join(lock_directory, f"{name}.lock"), "a+") as f:
+        while not _try_lock(f):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for the lock on {path}")
+            time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def coalesce(operations):
+    """Collapse a batch of (date, operation) pairs to the minimum that has the same effect.
+
+    Within a date only the last mark or delete per user survives, and a
+    clear discards everything queued before it. Returns {date: [operation]}.
+    """
+    batches = {}
+    for date, operation in operations:
+        cleared, by_user = batches.setdefault(date, [False, {}])
+        if operation["op"] == "clear":
+            batches[date] = [True, {}]
+        else:
+            # Re-insert so the user's latest operation keeps its position
+            by_user.pop(operation["id"], None)
+            by_user[operation["id"]] = operation
+
+    return {
+        date: ([{"op": "clear"}] if cleared else []) + list(by_user.values())
+        for date, (cleared, by_user) in batches.items()
+    }
+
+
+class AttendanceWriter:
+    """Moves attendance writes off the UI thread and batches them.
+
+    ``submit`` only queues the change. A background thread drains the queue
+    once ``max_batch`` changes are waiting or the oldest has waited
+    ``flush_interval`` seconds, coalesces them, and appends each date's
+    batch to the journal with a single write and fsync. Every
+    ``compact_interval`` seconds the journal is folded into the day's
+    snapshot, which the storage writes to a temporary file and renames into
+    place. ``on_compact(date, entries)`` is called on the writer thread
+    after each compaction.
+
+    ``flush(compact=True)`` only returns True once a compaction that started
+    after every change submitted before the call was journalled has
+    finished without errors. A batch the journal fails to take is kept and
+    retried with the next one rather than counted as written.
+    """
+
+    def __init__(self, journal, flush_interval=0.25, max_batch=50,
+                 compact_interval=30.0, on_compact=None):
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compact_interval = compact_interval
+        self.on_compact = on_compact
+        self.queue = queue.Queue()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.condition = threading.Condition()
+        self.submitted = 0
+        self.written = 0
+        # Compaction requests are numbered; one is served by a clean
+        # compaction that starts once ``written`` reaches compact_target
+        self.compact_requests = 0
+        self.compacted_request = 0
+        self.compact_target = 0
+        self.failed = []
+        self.last_compaction = time.monotonic()
+        self.flushes = 0
+        self.records = 0
+        self.coalesced = 0
+        self.last_flush = 0.0
+        self.total_flush = 0.0
+        self.max_flush = 0.0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="attendance-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, date, op, user_id=None, record=None):
+        """Queue one operation ("mark", "delete" or "clear") for a date without blocking"""
+        operation = {"op": op}
+        if user_id is not None:
+            operation["id"] = user_id
+        if record is not None:
+            operation["record"] = record
+        with self.condition:
+            self.submitted += 1
+        self.queue.put((date, operation))
+
+    def _collect(self):
+        """Block until a batch is due and return it (empty on a timeout or stop)"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stop_event.is_set() or self._compaction_owed():
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch):
+        """Journal a batch; anything the journal refused is kept in ``failed`` for the next one"""
+        start = time.perf_counter()
+        batches = coalesce(batch)
+        done = set()
+        operations_written = 0
+        try:
+            for date, operations in batches.items():
+                self.journal.extend(date, operations)
+                done.add(date)
+                operations_written += len(operations)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+        elapsed = time.perf_counter() - start
+
+        # Keep the original operations, in order, so a retry coalesces the same way
+        self.failed = [(date, operation) for date, operation in batch if date not in done]
+        succeeded = len(batch) - len(self.failed)
+        with self.condition:
+            self.flushes += 1
+            self.records += succeeded
+            self.coalesced += succeeded - operations_written
+            self.last_flush = elapsed
+            self.total_flush += elapsed
+            self.max_flush = max(self.max_flush, elapsed)
+            self.written += succeeded
+            self.condition.notify_all()
+
+    def _compact(self):
+        """Fold every journalled date into its snapshot; returns True if none failed"""
+        clean = True
+        for date in self.journal.dates():
+            try:
+                entries = self.journal.compact(date)
+                if self.on_compact is not None:
+                    self.on_compact(date, entries)
+            except Exception as e:
+                clean = False
+                self.errors += 1
+                self.last_error = str(e)
+        self.last_compaction = time.monotonic()
+        return clean
+
+    def _compaction_owed(self):
+        return self.compacted_request < self.compact_requests
+
+    def _compact_and_notify(self):
+        with self.condition:
+            # Only a compaction that starts after the requested changes are journalled serves them
+            served = self.compact_requests if self.written >= self.compact_target else 0
+        clean = self._compact()
+        with self.condition:
+            if clean:
+                self.compacted_request = max(self.compacted_request, served)
+            self.condition.notify_all()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self.failed + self._collect()
+            if batch:
+                self._write(batch)
+
+            with self.condition:
+                owed = self._compaction_owed() and self.written >= self.compact_target
+            if owed or time.monotonic() - self.last_compaction >= self.compact_interval:
+                self._compact_and_notify()
+
+        # Write whatever arrived while stopping, then leave a compact snapshot
+        batch = self.failed + self._drain()
+        if batch:
+            self._write(batch)
+        self._compact_and_notify()
+
+    def flush(self, compact=False, timeout=5.0):
+        """Wait until every change submitted so far is journalled (and compacted, if asked)"""
+        if self.thread is None or not self.thread.is_alive():
+            return False
+        with self.condition:
+            target = self.submitted
+            request = 0
+            if compact:
+                self.compact_requests += 1
+                request = self.compact_requests
+                self.compact_target = max(self.compact_target, target)
+            return self.condition.wait_for(
+                lambda: self.written >= target and self.compacted_request >= request, timeout
+            )
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def metrics(self):
+        """Queue depth and flush latency, for display and tuning"""
+        with self.condition:
+            return {
+                "queue_depth": self.queue.qsize() + len(self.failed),
+                "flushes": self.flushes,
+                "records": self.records,
+                "coalesced": self.coalesced,
+                "last_flush_ms": 1000.0 * self.last_flush,
+                "avg_flush_ms": 1000.0 * self.total_flush / self.flushes if self.flushes else 0.0,
+                "max_flush_ms": 1000.0 * self.max_flush,
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
+
+
+def _stress_worker(directory, date, worker, marks):
+    from attendance_storage import JsonStorage
+
+    storage = JsonStorage(directory)
+    for i in range(marks):
+        storage.merge_day(date, {f"{worker}-{i}": {"name": f"Worker {worker}", "status": "On Time"}})
+
+
+def stress_test(processes=8, marks=200, directory=None):
+    """Mark attendance for one date from several processes at once.
+
+    Every process merges its own students into the same day, so any lost
+    update shows up as a missing entry. Returns (expected, stored, seconds).
+    """
+    from attendance_storage import JsonStorage
+
+    directory = directory or tempfile.mkdtemp(prefix="attendance_stress_")
+    date = "2000-01-01"
+    context = mp.get_context("spawn")
+    workers = [
+        context.Process(target=_stress_worker, args=(directory, date, worker, marks))
+        for worker in range(processes)
+    ]
+    start = time.perf_counter()
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    return processes * marks, len(JsonStorage(directory).load_day(date)), elapsed
+
+
+class _FlakyJournal:
+    """An AttendanceJournal whose first ``failures`` batch writes raise OSError"""
+
+    def __init__(self, journal, failures):
+        self.journal = journal
+        self.failures = failures
+
+    def extend(self, date, operations):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("simulated journal write failure")
+        self.journal.extend(date, operations)
+
+    def __getattr__(self, name):
+        return getattr(self.journal, name)
+
+
+def check_flush(marks=60, failures=0, directory=None):
+    """Submit marks, flush(compact=True) and see what reached the snapshot.
+
+    With ``failures`` the first batch writes fail and must be retried, not
+    dropped. Returns (flush result, entries in the snapshot, journal bytes left).
+    """
+    from attendance_journal import AttendanceJournal
+    from attendance_storage import JsonStorage
+
+    directory = directory or tempfile.mkdtemp(prefix="attendance_flush_")
+    date = "2000-01-01"
+    storage = JsonStorage(directory)
+    journal = AttendanceJournal(storage, os.path.join(directory, "attendance_journal"))
+    writer = AttendanceWriter(_FlakyJournal(journal, failures) if failures else journal,
+                              flush_interval=0.05, compact_interval=3600)
+    writer.start()
+    for i in range(marks):
+        writer.submit(date, "mark", str(i), {"name": f"Student {i}", "status": "On Time"})
+    flushed = writer.flush(compact=True, timeout=10.0)
+    stored = len(storage.load_day(date))
+    path = journal.path(date)
+    left = os.path.getsize(path) if os.path.exists(path) else 0
+    writer.stop()
+    journal.close()
+    return flushed, stored, left
+
+
+if __name__ == "__main__":
+    ok = True
+    for failures in (0, 2):
+        flushed, stored, left = check_flush(failures=failures)
+        passed = flushed and stored == 60 and left == 0
+        ok = ok and passed
+        print(f"flush(compact=True), {failures} failed writes: returned {flushed}, "
+              f"{stored} of 60 in the snapshot, {left} journal bytes left"
+              f"{'' if passed else '  FAILED'}")
+
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    marks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    expected, stored, elapsed = stress_test(processes, marks)
+    print(f"{processes} processes x {marks} marks in {elapsed:.2f}s: "
+          f"{stored} of {expected} entries stored")
+    sys.exit(0 if ok and stored == expected else 1)
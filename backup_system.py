@@ -0,0 +1,283 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from attendance_journal import write_json_atomic
+from attendance_writer import file_lock
+
+BACKUP_FREQUENCIES = {
+    "hourly": 3600,
+    "daily": 86400,
+    "weekly": 7 * 86400,
+    "monthly": 30 * 86400,
+}
+
+DEFAULT_BACKUP_SETTINGS = {
+    "backup_directory": "backups",
+    "backup_frequency": "daily",
+    "retention_days": 30,
+    "enabled": True,
+}
+
+# Files that make up the application's state, relative to the data directory
+BACKUP_SOURCES = (
+    "settings.json",
+    "user_records.json",
+    "attendance_*.json",
+    "attendance_archive/*.npz",
+    # Marks not yet compacted into their day
+    "attendance_journal/*.jsonl",
+    "*.db",
+)
+
+
+class BackupSystem:
+    """Incremental, content-addressed snapshots of the application's data files.
+
+    Each file is stored once as a zlib-compressed object named by the
+    SHA-256 of its contents under ``<backup_directory>/objects``, so
+    unchanged files cost nothing on later snapshots. A snapshot is a small
+    ``backup_<timestamp>.json`` manifest mapping each path to its object.
+    Files whose size and mtime match the previous manifest are not even
+    re-read. SQLite databases are copied with the online backup API first,
+    so a snapshot taken while the apps run is consistent.
+
+    ``start`` runs snapshots on a background thread every
+    ``backup_frequency``. Manifests older than ``retention_days`` are
+    removed (the newest is always kept), followed by any object no remaining
+    manifest refers to.
+    """
+
+    def __init__(self, settings=None, directory=".", sources=BACKUP_SOURCES, before_backup=None):
+        self.settings = dict(DEFAULT_BACKUP_SETTINGS)
+        self.settings.update(settings or {})
+        self.directory = directory
+        self.sources = sources
+        self.before_backup = before_backup
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_error = None
+
+    @property
+    def backup_directory(self):
+        return os.path.join(self.directory, self.settings["backup_directory"])
+
+    @property
+    def objects_directory(self):
+        return os.path.join(self.backup_directory, "objects")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_directory, digest[:2], digest[2:])
+
+    def manifests(self):
+        """Snapshot manifest file names, oldest first"""
+        try:
+            names = os.listdir(self.backup_directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.startswith("backup_") and n.endswith(".json"))
+
+    def load_manifest(self, name):
+        with open(os.path.join(self.backup_directory, name), "r") as f:
+            return json.load(f)
+
+    def source_files(self):
+        paths = set()
+        for pattern in self.sources:
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                if os.path.isfile(path):
+                    paths.add(os.path.relpath(path, self.directory))
+        return sorted(paths)
+
+    def _read(self, path):
+        if path.endswith(".db"):
+            # Copy through SQLite so WAL contents and in-flight writes are consistent
+            fd, temp_path = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+            try:
+                source = sqlite3.connect(path)
+                target = sqlite3.connect(temp_path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+                with open(temp_path, "rb") as f:
+                    return f.read()
+            finally:
+                os.remove(temp_path)
+
+        # JSON files are replaced atomically, so a plain read sees a whole version
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _store_object(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(zlib.compress(data, 6))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        return digest
+
+    def _write(self, path, data):
+        if path.endswith(".db"):
+            # Restore through SQLite so open connections and the WAL see the new pages
+            fd, temp_path = tempfile.mkstemp(suffix=".db")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                source = sqlite3.connect(temp_path)
+                target = sqlite3.connect(path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+            finally:
+                os.remove(temp_path)
+            return
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _read_object(self, digest):
+        with open(self.object_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Backup object {digest} is corrupt")
+        return data
+
+    def create_backup(self):
+        """Take a snapshot now; returns the manifest name, or None if it failed"""
+        with self.lock:
+            try:
+                if self.before_backup is not None:
+                    self.before_backup()
+
+                os.makedirs(self.backup_directory, exist_ok=True)
+                manifests = self.manifests()
+                previous = self.load_manifest(manifests[-1])["files"] if manifests else {}
+
+                files = {}
+                for relative_path in self.source_files():
+                    path = os.path.join(self.directory, relative_path)
+                    stat = os.stat(path)
+                    known = previous.get(relative_path)
+                    if (known and not path.endswith(".db")
+                            and known["size"] == stat.st_size
+                            and known["mtime_ns"] == stat.st_mtime_ns):
+                        files[relative_path] = known
+                        continue
+
+                    data = self._read(path)
+                    files[relative_path] = {
+                        "sha256": self._store_object(data),
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                    }
+
+                now = datetime.now()
+                name = f"backup_{now.strftime('%Y%m%d_%H%M%S')}.json"
+                write_json_atomic(
+                    os.path.join(self.backup_directory, name),
+                    {"created": now.isoformat(timespec="seconds"), "files": files},
+                )
+                self.prune()
+                self.last_error = None
+                return name
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Backup failed: {e}")
+                return None
+
+    def prune(self):
+        """Apply the retention policy and delete objects no manifest refers to"""
+        manifests = self.manifests()
+        cutoff = datetime.now() - timedelta(days=int(self.settings["retention_days"]))
+        for name in manifests[:-1]:
+            created = datetime.strptime(name[len("backup_"):-len(".json")], "%Y%m%d_%H%M%S")
+            if created < cutoff:
+                os.remove(os.path.join(self.backup_directory, name))
+
+        referenced = set()
+        for name in self.manifests():
+            referenced.update(entry["sha256"] for entry in self.load_manifest(name)["files"].values())
+
+        for root, _, files in os.walk(self.objects_directory):
+            prefix = os.path.basename(root)
+            for rest in files:
+                if prefix + rest not in referenced:
+                    os.remove(os.path.join(root, rest))
+
+    def restore_backup(self, backup_file):
+        """Write every file in a snapshot back into place; returns True on success.
+
+        Files created after the snapshot are left alone. Each file is written
+        under the same lock the apps use: JSON files are replaced atomically,
+        and databases are copied into the live file with SQLite's backup API.
+        """
+        with self.lock:
+            try:
+                manifest = self.load_manifest(os.path.basename(backup_file))
+                # Read everything first so a corrupt object aborts before any file changes
+                contents = {
+                    relative_path: self._read_object(entry["sha256"])
+                    for relative_path, entry in manifest["files"].items()
+                }
+                for relative_path, data in contents.items():
+                    path = os.path.join(self.directory, relative_path)
+                    with file_lock(path):
+                        self._write(path, data)
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Restore failed: {e}")
+                return False
+
+    def seconds_until_due(self):
+        manifests = self.manifests()
+        if not manifests:
+            return 0
+        last = datetime.strptime(manifests[-1][len("backup_"):-len(".json")], "%Y%m%d_%H%M%S")
+        interval = BACKUP_FREQUENCIES.get(self.settings["backup_frequency"], BACKUP_FREQUENCIES["daily"])
+        return max(0.0, interval - (datetime.now() - last).total_seconds())
+
+    def run(self, check_interval=60):
+        while not self.stop_event.is_set():
+            if self.settings["enabled"] and self.seconds_until_due() == 0:
+                self.create_backup()
+            self.stop_event.wait(check_interval)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="backup-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(5.0)
+            self.thread = None
+
+    def stats(self):
+        """Snapshot count and the compressed size of the object store"""
+        size = 0
+        for root, _, files in os.walk(self.objects_directory):
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return {"snapshots": len(self.manifests()), "stored_bytes": size, "last_error": self.last_error}
@@ -0,0 +1,455 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class LatestFrameBuffer:
+    """Single-slot buffer that always holds the most recent item.
+
+    Putting into a full slot replaces the unread item, so a slow consumer
+    only ever sees the newest frame instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._condition.notify_all()
+
+    def take(self, timeout=None):
+        """Remove and return the newest item, waiting up to timeout; None if there is none"""
+        with self._condition:
+            if self._item is None and not self._closed:
+                self._condition.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    def poll(self):
+        """Remove and return the newest item without waiting"""
+        with self._condition:
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class MotionGate:
+    """Cheap scene-change test that decides whether a frame is worth recognizing.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with a
+    running-average background; the change score is the fraction of
+    thumbnail pixels that differ by more than ``pixel_delta``. Frames scoring
+    below ``threshold`` are skipped, except that one frame is let through
+    every ``refresh_interval`` seconds so a person who walked in and stood
+    still is still recognized. A threshold of 0 lets every frame through.
+    """
+
+    def __init__(self, threshold=0.02, pixel_delta=25, learning_rate=0.05,
+                 max_width=160, refresh_interval=2.0):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.learning_rate = learning_rate
+        self.max_width = max_width
+        self.refresh_interval = refresh_interval
+        self.background = None
+        self.last_processed = 0.0
+        self.last_score = 0.0
+        self.processed = 0
+        self.gated = 0
+        self.lock = threading.Lock()
+
+    def _thumbnail(self, frame):
+        step = max(1, frame.shape[1] // self.max_width)
+        small = frame[::step, ::step].astype(np.float32)
+        if small.ndim == 3:
+            small = small.mean(axis=2)
+        return small
+
+    def should_process(self, frame):
+        """Update the background with this frame and report whether it changed enough"""
+        thumbnail = self._thumbnail(frame)
+        now = time.monotonic()
+
+        with self.lock:
+            if self.background is None or self.background.shape != thumbnail.shape:
+                self.background = thumbnail
+                score = 1.0
+            else:
+                difference = thumbnail - self.background
+                score = float(np.mean(np.abs(difference) > self.pixel_delta))
+                self.background += self.learning_rate * difference
+            self.last_score = score
+
+            if score >= self.threshold or now - self.last_processed >= self.refresh_interval:
+                self.last_processed = now
+                self.processed += 1
+                return True
+
+            self.gated += 1
+            return False
+
+    def stats(self):
+        """Processed and gated frame counters plus the latest change score"""
+        with self.lock:
+            return {
+                "processed": self.processed,
+                "gated": self.gated,
+                "last_score": self.last_score,
+            }
+
+
+class AdaptiveScheduler:
+    """Chooses detection resolution, frequency and upsampling from measured latency.
+
+    After every analysed frame the smoothed recognition latency is compared
+    with the per-frame budget of ``target_fps``. Over budget, the detection
+    scale steps down the ``scales`` ladder first and the detection interval
+    (analyse one frame in N) grows only once the smallest scale is reached;
+    well under budget, the steps are undone in reverse. HOG upsampling is
+    only used while the faces being found are small at the current scale,
+    and comes back after ``upsample_reset`` analysed frames without faces so
+    that people approaching from a distance are still picked up.
+    """
+
+    SCALES = (0.2, 0.25, 0.33, 0.5)
+
+    def __init__(self, target_fps=10.0, scales=SCALES, initial_scale=0.25, max_interval=4,
+                 small_face_px=80, smoothing=0.2, cooldown=10, upsample_reset=30):
+        self.budget = 1.0 / target_fps
+        self.scales = sorted(scales)
+        self.scale_index = min(
+            range(len(self.scales)), key=lambda i: abs(self.scales[i] - initial_scale)
+        )
+        self.max_interval = max_interval
+        self.small_face_px = small_face_px
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.upsample_reset = upsample_reset
+        self.interval = 1
+        self.upsample = 1
+        self.latency = None
+        self.frames = 0
+        self.frames_since_change = 0
+        self.frames_without_faces = 0
+        self.reason = "initial settings"
+        self.lock = threading.Lock()
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    def plan(self):
+        """Detection options for the next frame, or None if it should not be analysed"""
+        with self.lock:
+            self.frames += 1
+            if self.frames % self.interval:
+                return None
+            return {"scale": self.scale, "upsample": self.upsample}
+
+    def record(self, latency, face_heights):
+        """Feed back an analysed frame's latency and the full-frame heights of its faces"""
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+
+            if face_heights:
+                self.frames_without_faces = 0
+                smallest = min(face_heights) * self.scale
+                upsample = 1 if smallest < self.small_face_px else 0
+                if upsample != self.upsample:
+                    self.upsample = upsample
+                    self.reason = (
+                        f"smallest face {smallest:.0f}px at scale {self.scale}: "
+                        f"upsampling {'on' if upsample else 'off'}"
+                    )
+            else:
+                self.frames_without_faces += 1
+                if not self.upsample and self.frames_without_faces >= self.upsample_reset:
+                    self.upsample = 1
+                    self.reason = "no faces for a while: upsampling on to catch distant faces"
+
+            self.frames_since_change += 1
+            if self.frames_since_change < self.cooldown:
+                return
+
+            # Skipped frames are free, so the cost per camera frame is spread over the interval
+            cost = self.latency / self.interval
+            summary = f"{1000 * self.latency:.0f} ms per analysed frame, budget {1000 * self.budget:.0f} ms"
+            if cost > 1.1 * self.budget:
+                if self.scale_index > 0:
+                    self.scale_index -= 1
+                    self.reason = f"{summary}: scale down to {self.scale}"
+                elif self.interval < self.max_interval:
+                    self.interval += 1
+                    self.reason = f"{summary}: analyse every {self.interval} frames"
+                else:
+                    return
+            elif self.interval > 1 and self.latency / (self.interval - 1) < 0.8 * self.budget:
+                self.interval -= 1
+                self.reason = f"{summary}: analyse every {self.interval} frames"
+            elif (self.interval == 1 and self.latency < 0.5 * self.budget
+                  and self.scale_index < len(self.scales) - 1):
+                # A step up the ladder roughly doubles the pixels to scan
+                self.scale_index += 1
+                self.reason = f"{summary}: scale up to {self.scale}"
+            else:
+                return
+            self.frames_since_change = 0
+
+    def decisions(self):
+        """Current choices and the reason for the latest change, for display"""
+        with self.lock:
+            return {
+                "scale": self.scale,
+                "interval": self.interval,
+                "upsample": self.upsample,
+                "latency_ms": 1000 * self.latency if self.latency is not None else None,
+                "reason": self.reason,
+            }
+
+
+def plan_detection(frame, motion_gate=None, scheduler=None):
+    """Detection options for a frame, or None to display it without analysis"""
+    if motion_gate is not None and not motion_gate.should_process(frame):
+        return None
+    if scheduler is None:
+        return {}
+    return scheduler.plan()
+
+
+class CaptureThread(threading.Thread):
+    """Producer that keeps grabbing frames from the camera into a LatestFrameBuffer"""
+
+    def __init__(self, camera, frames, stop_event):
+        super().__init__(name="camera-capture", daemon=True)
+        self.camera = camera
+        self.frames = frames
+        self.stop_event = stop_event
+        self.captured = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            ret, frame = self.camera.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            self.captured += 1
+            self.frames.put(frame)
+
+
+class RecognitionWorker(threading.Thread):
+    """Consumer that runs recognition on the newest captured frame.
+
+    ``detect(frame)`` returns ``(locations, encodings)`` and
+    ``annotate(frame, locations, encodings)`` returns ``(display_image, matches)``;
+    frames skipped by the motion gate are annotated with ``None`` for both.
+    The image is published to a LatestFrameBuffer for the UI to blit, while
+    matches go to an unbounded queue so that no recognition is lost when
+    frames are dropped.
+    """
+
+    def __init__(self, frames, detect, annotate, display, matches, stop_event,
+                 motion_gate=None, scheduler=None):
+        super().__init__(name="face-recognition", daemon=True)
+        self.frames = frames
+        self.detect = detect
+        self.annotate = annotate
+        self.display = display
+        self.matches = matches
+        self.stop_event = stop_event
+        self.motion_gate = motion_gate
+        self.scheduler = scheduler
+        self.processed = 0
+
+
+    def publish(self, frame, locations, encodings, detect_time=None):
+        start = time.perf_counter()
+        image, matches = self.annotate(frame, locations, encodings)
+        if self.scheduler is not None and detect_time is not None:
+            self.scheduler.record(
+                detect_time + time.perf_counter() - start,
+                [bottom - top for top, _, bottom, _ in locations],
+            )
+        self.processed += 1
+        self.display.put(image)
+        if matches:
+            self.matches.put(matches)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            frame = self.frames.take(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                options = plan_detection(frame, self.motion_gate, self.scheduler)
+                if options is None:
+                    # Gated or scheduled out; show the frame without analysing it
+                    self.publish(frame, None, None)
+                else:
+                    start = time.perf_counter()
+                    locations, encodings = self.detect(frame, **options)
+                    self.publish(frame, locations, encodings, time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error in face recognition: {e}")
+
+
+class PoolDispatchThread(threading.Thread):
+    """Feeds the newest captured frames to a RecognitionEngine as slots free up"""
+
+    def __init__(self, frames, engine, stop_event, motion_gate=None, scheduler=None,
+                 static_frames=None):
+        super().__init__(name="recognition-dispatch", daemon=True)
+        self.frames = frames
+        self.engine = engine
+        self.stop_event = stop_event
+        self.motion_gate = motion_gate
+        self.scheduler = scheduler
+        self.static_frames = static_frames
+
+    def run(self):
+        frame = None
+        while not self.stop_event.is_set():
+            if frame is None:
+                frame = self.frames.take(timeout=0.1)
+                if frame is None:
+                    continue
+                options = plan_detection(frame, self.motion_gate, self.scheduler)
+                if options is None:
+                    # Gated or scheduled out; hand the frame straight to the display
+                    self.static_frames.put(frame)
+                    frame = None
+                    continue
+            if self.engine.submit(frame, timeout=0.1, options=options):
+                frame = None
+            else:
+                # Prefer a fresher frame if one arrived while the pool was busy
+                fresher = self.frames.poll()
+                if fresher is not None:
+                    frame = fresher
+
+
+class PoolCollectThread(RecognitionWorker):
+    """Collects RecognitionEngine results in order and annotates them"""
+
+    def __init__(self, engine, annotate, display, matches, stop_event, static_frames,
+                 scheduler=None):
+        super().__init__(
+            static_frames, None, annotate, display, matches, stop_event, scheduler=scheduler
+        )
+        self.name = "recognition-collect"
+        self.engine = engine
+
+    def run(self):
+        while not self.stop_event.is_set():
+            result = self.engine.next_result(timeout=0.05)
+            if result is None:
+                static_frame = self.frames.poll()
+                if static_frame is not None:
+                    self.publish(static_frame, None, None)
+                continue
+            try:
+                if result.error:
+                    print(f"Error in face recognition: {result.error}")
+                else:
+                    # Workers only detect; faces are encoded here, as the tracker asks.
+                    # Workers run in parallel, so each frame costs a share of their time
+                    frame = result.frame.copy()
+                    self.publish(
+                        frame, result.locations, self.engine.encodings(frame, result),
+                        result.elapsed / self.engine.workers,
+                    )
+            except Exception as e:
+                print(f"Error in face recognition: {e}")
+            finally:
+                self.engine.release(result)
+
+
+class CameraPipeline:
+    """Capture and recognition threads that run independently of the Tk event loop.
+
+    Without an engine, detection runs on a single recognition thread. With a
+    RecognitionEngine from recognition_pool, detection is spread over its
+    worker processes and this process only encodes the faces the tracker
+    needs, matches and annotates. An optional MotionGate keeps static frames
+    away from recognition entirely, and an optional AdaptiveScheduler picks
+    the detection options per frame.
+    """
+
+    def __init__(self, camera, detect, annotate, engine=None, motion_gate=None, scheduler=None):
+        self.stop_event = threading.Event()
+        self.frames = LatestFrameBuffer()
+        self.display = LatestFrameBuffer()
+        self.matches = queue.Queue()
+        self.motion_gate = motion_gate
+        self.scheduler = scheduler
+        self.capture_thread = CaptureThread(camera, self.frames, self.stop_event)
+        if engine is None:
+            self.workers = [
+                RecognitionWorker(
+                    self.frames, detect, annotate, self.display, self.matches,
+                    self.stop_event, motion_gate, scheduler,
+                )
+            ]
+        else:
+            static_frames = LatestFrameBuffer()
+            self.workers = [
+                PoolDispatchThread(
+                    self.frames, engine, self.stop_event, motion_gate, scheduler, static_frames
+                ),
+                PoolCollectThread(
+                    engine, annotate, self.display, self.matches, self.stop_event,
+                    static_frames, scheduler,
+                ),
+            ]
+
+    def start(self):
+        self.capture_thread.start()
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        self.frames.close()
+        self.display.close()
+        self.capture_thread.join(timeout)
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def stats(self):
+        """Frame counters for tuning: captured, recognized and motion-gated"""
+        stats = {
+            "captured": self.capture_thread.captured,
+            "dropped": self.frames.dropped,
+        }
+        if self.motion_gate is not None:
+            stats.update(self.motion_gate.stats())
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.decisions()
+        return stats
+
+    def latest_image(self):
+        """Most recent annotated frame not yet shown, or None"""
+        return self.display.poll()
+
+    def pending_matches(self):
+        """Drain and return every match reported since the last call"""
+        matches = []
+        while True:
+            try:
+                matches.extend(self.matches.get_nowait())
+            except queue.Empty:
+                return matches
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+ENCODING_SIZE = 128
+ENCODING_DTYPE = np.float32
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """Persistent store of face encodings keyed by photo path, mtime and content hash.
+
+    Encodings live in one ``.npy`` matrix that is memory-mapped on load, and
+    ``index.json`` maps each photo path to its row together with the mtime,
+    size and SHA-1 the encoding was computed from. Photos in which no face
+    was found are remembered with row -1 so they are not re-encoded either.
+    Every method may be called from several encoding threads at once.
+    """
+
+    def __init__(self, cache_dir="face_cache"):
+        self.cache_dir = cache_dir
+        self.matrix_path = os.path.join(cache_dir, "encodings.npy")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index = {}
+        self.matrix = np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+        self.pending = []
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the index and memory-map the encoding matrix"""
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, OSError):
+            return
+
+        # Discard a cache whose index and matrix disagree
+        if matrix.ndim != 2 or matrix.shape[1] != ENCODING_SIZE:
+            return
+        if any(entry["row"] >= len(matrix) for entry in index.values()):
+            return
+
+        self.index = index
+        self.matrix = matrix
+
+    def _row(self, row):
+        if row < 0:
+            return None
+        if row < len(self.matrix):
+            return np.array(self.matrix[row])
+        return self.pending[row - len(self.matrix)]
+
+    def lookup(self, path):
+        """Return (found, encoding) for a photo; found is False if missing or stale"""
+        key = os.path.normpath(path)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return False, None
+
+            try:
+                stat = os.stat(key)
+            except OSError:
+                return False, None
+
+            if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                return True, self._row(entry["row"])
+
+            # The file was touched; only re-encode if its contents actually changed
+            if file_digest(key) == entry["sha1"]:
+                entry["mtime_ns"] = stat.st_mtime_ns
+                entry["size"] = stat.st_size
+                self.dirty = True
+                return True, self._row(entry["row"])
+
+            return False, None
+
+    def store(self, path, encoding):
+        """Record the encoding computed for a photo (None if no face was found)"""
+        key = os.path.normpath(path)
+        stat = os.stat(key)
+        sha1 = file_digest(key)
+
+        with self.lock:
+            row = -1
+            if encoding is not None:
+                row = len(self.matrix) + len(self.pending)
+                self.pending.append(np.asarray(encoding, dtype=ENCODING_DTYPE))
+
+            self.index[key] = {
+                "row": row,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha1": sha1,
+            }
+            self.dirty = True
+
+    def prune(self, paths):
+        """Forget every photo that is not in paths"""
+        keep = {os.path.normpath(path) for path in paths}
+        with self.lock:
+            for key in list(self.index):
+                if key not in keep:
+                    del self.index[key]
+                    self.dirty = True
+
+    def save(self):
+        """Write the matrix and index back to disk, compacting unused rows"""
+        with self.lock:
+            if not self.dirty:
+                return
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            rows = []
+            for entry in self.index.values():
+                if entry["row"] >= 0:
+                    rows.append(self._row(entry["row"]))
+                    entry["row"] = len(rows) - 1
+
+            if rows:
+                matrix = np.vstack(rows).astype(ENCODING_DTYPE)
+            else:
+                matrix = np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+
+            # Release the memory map before replacing the file underneath it
+            self.matrix = matrix
+            self.pending = []
+
+            temp_matrix = self.matrix_path + ".tmp.npy"
+            np.save(temp_matrix, matrix)
+            os.replace(temp_matrix, self.matrix_path)
+
+            temp_index = self.index_path + ".tmp"
+            with open(temp_index, "w") as f:
+                json.dump(self.index, f)
+            os.replace(temp_index, self.index_path)
+
+            self.dirty = False
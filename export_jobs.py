@@ -0,0 +1,366 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+EXPORT_COLUMNS = ("ID", "Name", "Department", "Time", "Status", "Minutes Late", "Date", "Time Zone")
+SUMMARY_STATUSES = ("On Time", "Within Grace Period", "Late")
+# Rows written per write_column call, between progress reports and cancellation checks
+CHUNK_ROWS = 5000
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def minutes_late(status):
+    if "Late by" not in status:
+        return 0
+    try:
+        return int(status.split("Late by ")[1].split(" ")[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+def date_range(start, end):
+    """Every "YYYY-MM-DD" from start to end inclusive"""
+    day = datetime.strptime(start, "%Y-%m-%d")
+    last = datetime.strptime(end, "%Y-%m-%d")
+    dates = []
+    while day <= last:
+        dates.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return dates
+
+
+def collect_columns(days, user_data, departments=None):
+    """Turn [(date, {user_id: record})] into {column: [values]} in EXPORT_COLUMNS order.
+
+    Rows are ordered by date, then user id. Departments come from the user
+    records, as marks do not carry them; ``departments`` keeps only those.
+    """
+    columns = {column: [] for column in EXPORT_COLUMNS}
+    for date, records in days:
+        for user_id in sorted(records):
+            record = records[user_id]
+            department = user_data.get(user_id, {}).get("department", "N/A")
+            if departments and department not in departments:
+                continue
+            status = record.get("status", "")
+            columns["ID"].append(user_id)
+            columns["Name"].append(record.get("name", ""))
+            columns["Department"].append(department)
+            columns["Time"].append(record.get("time", ""))
+            columns["Status"].append(status)
+            columns["Minutes Late"].append(minutes_late(status))
+            columns["Date"].append(date)
+            columns["Time Zone"].append(record.get("timezone", "Asia/Baghdad"))
+    return columns
+
+
+def sheet_name(name, used):
+    """A unique worksheet name Excel accepts (31 characters, none of []:*?/\\)"""
+    cleaned = "".join("_" if c in "[]:*?/\\" else c for c in name)[:31] or "Sheet"
+    candidate, n = cleaned, 2
+    while candidate.lower() in used:
+        suffix = f" ({n})"
+        candidate, n = cleaned[:31 - len(suffix)] + suffix, n + 1
+    used.add(candidate.lower())
+    return candidate
+
+
+class WorkbookWriter:
+    """Writes collected columns into an .xlsx with bulk column writes.
+
+    Sheets:
+    - Attendance holds every row.
+    - When more than one department is present, each department gets its own sheet.
+    - Summary, Daily (for more than one date) and DeptAnalysis hold the
+      counts.
+    - Analytics charts those counts.
+
+    ``progress(done, total)`` is called after every chunk of cells. Setting
+    ``cancel_event`` stops the export at the next chunk with ExportCancelled.
+    """
+
+    def __init__(self, columns, progress=None, cancel_event=None):
+        self.columns = columns
+        self.rows = len(columns["ID"])
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.departments = sorted(set(columns["Department"]))
+        self.dates = sorted(set(columns["Date"]))
+        self.done = 0
+        self.total = self.rows * len(EXPORT_COLUMNS) * (2 if len(self.departments) > 1 else 1)
+
+    def _advance(self, cells):
+        self.done += cells
+        if self.progress is not None:
+            self.progress(self.done, self.total)
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ExportCancelled()
+
+    def _write_table(self, worksheet, columns, header_format, cell_format):
+        rows = len(columns["ID"])
+        for col, name in enumerate(EXPORT_COLUMNS):
+            values = columns[name]
+            worksheet.write(0, col, name, header_format)
+            for start in range(0, rows, CHUNK_ROWS):
+                chunk = values[start:start + CHUNK_ROWS]
+                worksheet.write_column(start + 1, col, chunk, cell_format)
+                self._advance(len(chunk))
+            width = max((len(str(value)) for value in values), default=0)
+            worksheet.set_column(col, col, max(width, len(name)) + 2)
+
+    def write(self, filename):
+        # Imported here so the desktop app starts without xlsxwriter installed
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(filename)
+        try:
+            self._write_workbook(workbook)
+        except ExportCancelled:
+            # Close so xlsxwriter does not complain; the caller discards the file
+            workbook.close()
+            raise
+        workbook.close()
+
+    def _write_workbook(self, workbook):
+        header_format = workbook.add_format({"bold": True, "align": "center", "bg_color": "#D3D3D3", "border": 1})
+        cell_format = workbook.add_format({"align": "center", "border": 1})
+        used = set()
+
+        self._write_table(
+            workbook.add_worksheet(sheet_name("Attendance", used)), self.columns, header_format, cell_format
+        )
+
+        if len(self.departments) > 1:
+            rows_by_department = {department: [] for department in self.departments}
+            for i, department in enumerate(self.columns["Department"]):
+                rows_by_department[department].append(i)
+            for department in self.departments:
+                indices = rows_by_department[department]
+                subset = {name: [self.columns[name][i] for i in indices] for name in EXPORT_COLUMNS}
+                self._write_table(
+                    workbook.add_worksheet(sheet_name(department, used)), subset, header_format, cell_format
+                )
+
+        statuses = self.columns["Status"]
+        late_minutes = self.columns["Minutes Late"]
+        summary = [
+            ("Total Entries", self.rows),
+            ("On Time", statuses.count("On Time")),
+            ("Within Grace Period", statuses.count("Within Grace Period")),
+            ("Late", sum(1 for status in statuses if "Late" in status)),
+            ("Average Minutes Late", sum(late_minutes) / self.rows if self.rows else 0),
+        ]
+        summary_sheet = workbook.add_worksheet(sheet_name("Summary", used))
+        summary_sheet.write_row(0, 0, ("Metric", "Value"), header_format)
+        summary_sheet.write_column(1, 0, [metric for metric, _ in summary])
+        summary_sheet.write_column(1, 1, [value for _, value in summary])
+        summary_sheet.set_column("A:A", 20)
+        summary_sheet.set_column("B:B", 15)
+
+        daily_sheet = None
+        if len(self.dates) > 1:
+            daily = {date: [0, 0, 0, 0] for date in self.dates}
+            for date, status in zip(self.columns["Date"], statuses):
+                counts = daily[date]
+                counts[0] += 1
+                if status == "On Time":
+                    counts[1] += 1
+                elif status == "Within Grace Period":
+                    counts[2] += 1
+                elif "Late" in status:
+                    counts[3] += 1
+            daily_sheet = workbook.add_worksheet(sheet_name("Daily", used))
+            daily_sheet.write_row(0, 0, ("Date", "Total") + SUMMARY_STATUSES, header_format)
+            daily_sheet.write_column(1, 0, self.dates)
+            for col in range(4):
+                daily_sheet.write_column(1, col + 1, [daily[date][col] for date in self.dates])
+            daily_sheet.set_column(0, 4, 20)
+
+        department_counts = [self.columns["Department"].count(department) for department in self.departments]
+        dept_sheet = workbook.add_worksheet(sheet_name("DeptAnalysis", used))
+        dept_sheet.write_row(0, 0, ("Department", "Count"), header_format)
+        dept_sheet.write_column(1, 0, self.departments)
+        dept_sheet.write_column(1, 1, department_counts)
+
+        chart_sheet = workbook.add_worksheet(sheet_name("Analytics", used))
+        pie_chart = workbook.add_chart({"type": "pie"})
+        pie_chart.add_series({
+            "name": "Attendance Status",
+            "categories": [summary_sheet.name, 2, 0, 4, 0],
+            "values": [summary_sheet.name, 2, 1, 4, 1],
+        })
+        pie_chart.set_title({"name": "Attendance Status Distribution"})
+        chart_sheet.insert_chart("A2", pie_chart)
+
+        bar_chart = workbook.add_chart({"type": "column"})
+        bar_chart.add_series({
+            "name": "Department Attendance",
+            "categories": [dept_sheet.name, 1, 0, len(self.departments), 0],
+            "values": [dept_sheet.name, 1, 1, len(self.departments), 1],
+        })
+        bar_chart.set_title({"name": "Attendance by Department"})
+        chart_sheet.insert_chart("A18", bar_chart)
+
+        if daily_sheet is not None:
+            line_chart = workbook.add_chart({"type": "line"})
+            for col, name in enumerate(SUMMARY_STATUSES, start=2):
+                line_chart.add_series({
+                    "name": name,
+                    "categories": [daily_sheet.name, 1, 0, len(self.dates), 0],
+                    "values": [daily_sheet.name, 1, col, len(self.dates), col],
+                })
+            line_chart.set_title({"name": "Daily Attendance"})
+            chart_sheet.insert_chart("J2", line_chart)
+
+
+class ExportJob:
+    """Builds an attendance workbook on a background thread.
+
+    ``load_day(date)`` must return {date: {user_id: record}}, as
+    AttendanceJournal.load_day does, and is called from the job's thread.
+    ``on_progress(stage, done, total)`` is called from that thread too; a Tk
+    caller should only record the values and poll ``status()`` from the UI.
+    The workbook is written to a temporary file next to ``filename`` and
+    moved into place only when complete, so a cancelled or failed export
+    leaves nothing behind.
+    """
+
+    def __init__(self, filename, dates, load_day, user_data, departments=None, on_progress=None):
+        self.filename = filename
+        self.dates = list(dates)
+        self.load_day = load_day
+        self.user_data = dict(user_data)
+        self.departments = set(departments or ())
+        self.on_progress = on_progress
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stage = "Queued"
+        self.done = 0
+        self.total = 0
+        self.rows = 0
+        self.sheets = []
+        self.error = None
+        self.elapsed = 0.0
+
+    def _report(self, stage, done, total):
+        with self.lock:
+            self.stage, self.done, self.total = stage, done, total
+        if self.on_progress is not None:
+            self.on_progress(stage, done, total)
+
+    def status(self):
+        """(stage, fraction done); stage ends as "Done", "Cancelled" or "Failed" """
+        with self.lock:
+            return self.stage, (self.done / self.total if self.total else 0.0)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="attendance-export", daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return not self.is_running()
+
+    def run(self):
+        start = time.perf_counter()
+        temp_path = None
+        try:
+            days = []
+            for i, date in enumerate(self.dates):
+                if self.cancel_event.is_set():
+                    raise ExportCancelled()
+                records = self.load_day(date).get(date, {})
+                if records:
+                    days.append((date, records))
+                self._report("Loading", i + 1, len(self.dates))
+
+            columns = collect_columns(days, self.user_data, self.departments)
+            self.rows = len(columns["ID"])
+            if not self.rows:
+                raise ValueError("No records found for the selected dates and departments")
+
+            writer = WorkbookWriter(
+                columns, lambda done, total: self._report("Writing", done, total), self.cancel_event
+            )
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+            os.close(fd)
+            writer.write(temp_path)
+            os.replace(temp_path, self.filename)
+            temp_path = None
+            self.sheets = ["Attendance"] + (writer.departments if len(writer.departments) > 1 else [])
+            self._report("Done", writer.total, writer.total)
+        except ExportCancelled:
+            self._report("Cancelled", self.done, self.total)
+        except Exception as e:
+            self.error = str(e)
+            self._report("Failed", self.done, self.total)
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.elapsed = time.perf_counter() - start
+
+
+def benchmark_export(rows=50000, departments=("IT", "Chemistry", "English", "Microbiology")):
+    """Rows per second of the old DataFrame + per-cell writer and of ExportJob"""
+    import pandas as pd
+
+    students = 1000
+    user_data = {
+        str(i).zfill(6): {"name": f"Student {i}", "department": departments[i % len(departments)]}
+        for i in range(students)
+    }
+    statuses = ("On Time", "Within Grace Period", "Late by 12 minutes")
+    dates = [(datetime(2024, 1, 1) + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(rows // students)]
+    store = {
+        date: {
+            user_id: {"name": info["name"], "time": "08:05:00", "status": statuses[i % 3],
+                      "timezone": "Asia/Baghdad"}
+            for i, (user_id, info) in enumerate(user_data.items())
+        }
+        for date in dates
+    }
+    directory = tempfile.mkdtemp(prefix="export_jobs_")
+
+    # Before: one DataFrame, then df.iloc per cell, as export_records did on the Tk thread
+    start = time.perf_counter()
+    columns = collect_columns(list(store.items()), user_data)
+    df = pd.DataFrame({name: columns[name] for name in EXPORT_COLUMNS})
+    with pd.ExcelWriter(os.path.join(directory, "before.xlsx"), engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="Attendance", index=False)
+        worksheet = writer.sheets["Attendance"]
+        cell_format = writer.book.add_format({"align": "center", "border": 1})
+        for row in range(len(df)):
+            for col in range(len(df.columns)):
+                worksheet.write(row + 1, col, df.iloc[row, col], cell_format)
+    before = time.perf_counter() - start
+
+    job = ExportJob(os.path.join(directory, "after.xlsx"), dates, lambda date: {date: store[date]}, user_data)
+    job.start().wait()
+    if job.error:
+        raise RuntimeError(job.error)
+    return {"rows": job.rows, "before_rows_s": job.rows / before, "after_rows_s": job.rows / job.elapsed}
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    results = benchmark_export(rows)
+    print(f"{results['rows']} rows")
+    print(f"DataFrame + per-cell iloc writes: {results['before_rows_s']:10.0f} rows/s")
+    print(f"ExportJob, bulk column writes:    {results['after_rows_s']:10.0f} rows/s "
+          f"(includes per-department sheets)")
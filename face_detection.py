@@ -0,0 +1,218 @@
+import sys
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+from face_tracker import box_iou
+
+
+DEFAULT_SCALE = 0.25
+
+
+def small_rgb_frame(frame, scale):
+    """The downscaled RGB copy of a BGR frame that detection and encoding run on"""
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    return np.ascontiguousarray(small_frame[:, :, ::-1])
+
+
+class LazyEncodings:
+    """Face encodings for a list of boxes, computed only for the boxes indexed"""
+
+    def __init__(self, rgb_small_frame, small_locations):
+        self.rgb_small_frame = rgb_small_frame
+        self.small_locations = small_locations
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.small_locations)
+
+    def __getitem__(self, index):
+        if index not in self.cache:
+            self.cache[index] = face_recognition.face_encodings(
+                self.rgb_small_frame, [self.small_locations[index]]
+            )[0]
+        return self.cache[index]
+
+
+class HogDetector:
+    """dlib's HOG detector over the whole frame (the face_recognition default)"""
+
+    name = "hog"
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def locate(self, rgb_frame, upsample=None):
+        if upsample is None:
+            upsample = self.upsample
+        return face_recognition.face_locations(rgb_frame, upsample)
+
+
+class HaarCascadeDetector:
+    """Two-stage detector: a fast Haar cascade proposes regions, HOG confirms them.
+
+    The cascade runs on the grayscale frame and each proposal, padded by
+    ``margin`` of its size, is cropped and passed to the HOG detector. HOG
+    therefore only scans the few regions that plausibly hold a face, and
+    Haar false positives are filtered out by it.
+    """
+
+    name = "haar"
+
+    def __init__(self, cascade=None, upsample=1, margin=0.3, scale_factor=1.1,
+                 min_neighbors=4, min_size=(20, 20)):
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            )
+        self.cascade = cascade
+        self.upsample = upsample
+        self.margin = margin
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def propose(self, rgb_frame):
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        return self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size,
+        )
+
+    def locate(self, rgb_frame, upsample=None):
+        if upsample is None:
+            upsample = self.upsample
+        height, width = rgb_frame.shape[:2]
+        locations = []
+        for x, y, w, h in self.propose(rgb_frame):
+            pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+            crop = np.ascontiguousarray(rgb_frame[y0:y1, x0:x1])
+
+            for top, right, bottom, left in face_recognition.face_locations(crop, upsample):
+                box = (top + y0, right + x0, bottom + y0, left + x0)
+                # Overlapping proposals can confirm the same face twice
+                if all(box_iou(box, other) < 0.5 for other in locations):
+                    locations.append(box)
+        return locations
+
+
+FACE_DETECTORS = {
+    HogDetector.name: HogDetector,
+    HaarCascadeDetector.name: HaarCascadeDetector,
+}
+
+_detectors = {}
+
+
+def get_detector(detector=None):
+    """Resolve a detector object, a backend name, or None (HOG) to a detector"""
+    if detector is None:
+        detector = HogDetector.name
+    if not isinstance(detector, str):
+        return detector
+    if detector not in _detectors:
+        try:
+            _detectors[detector] = FACE_DETECTORS[detector]()
+        except KeyError:
+            raise ValueError(f"Unknown face detector: {detector}")
+    return _detectors[detector]
+
+
+def detect_faces(frame, scale=DEFAULT_SCALE, lazy=False, detector=None, upsample=None):
+    """Detect and encode the faces in a BGR camera frame.
+
+    Detection runs on a copy downscaled by ``scale``; the returned
+    (top, right, bottom, left) boxes are in full-frame coordinates. With
+    ``lazy`` the encodings are a LazyEncodings, so a face tracker only pays
+    for the faces it needs to identify. ``detector`` is a detector object or
+    the name of one of FACE_DETECTORS, defaulting to HOG; ``upsample``
+    overrides the detector's own upsampling.
+    """
+    rgb_small_frame = small_rgb_frame(frame, scale)
+
+    face_locations = get_detector(detector).locate(rgb_small_frame, upsample)
+    if lazy:
+        face_encodings = LazyEncodings(rgb_small_frame, face_locations)
+    else:
+        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+
+    locations = [
+        tuple(int(round(value / scale)) for value in location)
+        for location in face_locations
+    ]
+    return locations, face_encodings
+
+
+def lazy_encodings(frame, small_locations, scale=DEFAULT_SCALE):
+    """LazyEncodings for boxes detect_faces found in ``frame`` at ``scale`` elsewhere.
+
+    ``small_locations`` are the boxes in the downscaled frame, as a worker
+    process gets them from its own LazyEncodings.
+    """
+    return LazyEncodings(small_rgb_frame(frame, scale), small_locations)
+
+
+def benchmark_detectors(video_path, max_frames=300, scale=0.25):
+    """Time each detection backend on recorded footage.
+
+    Reports milliseconds per frame, faces found, and recall against the HOG
+    detector (a HOG box counts as found if a box with IoU >= 0.5 exists).
+    """
+    capture = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+        frames.append(np.ascontiguousarray(small_frame[:, :, ::-1]))
+    capture.release()
+
+    if not frames:
+        raise ValueError(f"No frames could be read from {video_path}")
+
+    detections = {}
+    results = {}
+    for name, factory in FACE_DETECTORS.items():
+        detector = factory()
+        start = time.perf_counter()
+        detections[name] = [detector.locate(frame) for frame in frames]
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "ms_per_frame": 1000.0 * elapsed / len(frames),
+            "faces": sum(len(boxes) for boxes in detections[name]),
+        }
+
+    reference = detections[HogDetector.name]
+    total = sum(len(boxes) for boxes in reference)
+    for name, boxes_per_frame in detections.items():
+        found = sum(
+            1
+            for expected, boxes in zip(reference, boxes_per_frame)
+            for box in expected
+            if any(box_iou(box, other) >= 0.5 for other in boxes)
+        )
+        results[name]["recall_vs_hog"] = found / total if total else 1.0
+    return len(frames), results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python face_detection.py <recorded_video> [max_frames]")
+        sys.exit(1)
+
+    frame_count, results = benchmark_detectors(
+        sys.argv[1], max_frames=int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    )
+    print(f"{frame_count} frames from {sys.argv[1]}")
+    for name, result in results.items():
+        print(
+            f"{name:<5} {result['ms_per_frame']:7.2f} ms/frame  "
+            f"{result['faces']:5d} faces  recall vs hog={result['recall_vs_hog']:.3f}"
+        )
@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import namedtuple
+
+import face_recognition
+import numpy as np
+
+from encoding_cache import ENCODING_DTYPE, ENCODING_SIZE
+from gallery_index import BruteForceIndex
+
+FaceMatch = namedtuple("FaceMatch", ["user_id", "name", "distance", "margin"])
+
+
+class FaceGallery:
+    """In-memory gallery of enrolled faces that can be updated one user at a time.
+
+    Encodings are held in one contiguous float32 matrix (grown by doubling)
+    alongside their squared norms, so a whole frame can be matched with a
+    single matrix product. Nearest-neighbour search is delegated to a
+    pluggable index from gallery_index, which is told about every row that
+    is added, removed or moved. All public methods take a lock, since the
+    recognition thread matches while the UI thread enrolls. ``ids`` and ``names`` are parallel lists that are
+    only ever mutated in place, so callers may keep references to them.
+    Encodings come from the shared EncodingCache, which is written back by
+    ``load`` and by the owner on shutdown rather than after every change.
+    """
+
+    def __init__(self, encoding_cache, index=None, initial_capacity=64):
+        self.cache = encoding_cache
+        self.index = index if index is not None else BruteForceIndex()
+        self.ids = []
+        self.names = []
+        self.positions = {}
+        self.lock = threading.RLock()
+        self._buffer = np.zeros((initial_capacity, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+        self._norms = np.zeros(initial_capacity, dtype=ENCODING_DTYPE)
+
+    @property
+    def matrix(self):
+        """Enrolled encodings as an (n, 128) float32 view"""
+        return self._buffer[: len(self.ids)]
+
+    def _set_row(self, index, encoding):
+        if index >= len(self._buffer):
+            capacity = max(2 * len(self._buffer), index + 1)
+            buffer = np.zeros((capacity, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+            buffer[: len(self._buffer)] = self._buffer
+            norms = np.zeros(capacity, dtype=ENCODING_DTYPE)
+            norms[: len(self._norms)] = self._norms
+            self._buffer, self._norms = buffer, norms
+
+        self._buffer[index] = encoding
+        self._norms[index] = np.dot(self._buffer[index], self._buffer[index])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id):
+        return user_id in self.positions
+
+    def encode_photo(self, photo_path):
+        """Return the encoding for a photo, computing it only if not cached"""
+        found, encoding = self.cache.lookup(photo_path)
+        if not found:
+            image = face_recognition.load_image_file(photo_path)
+            face_encodings = face_recognition.face_encodings(image)
+            encoding = face_encodings[0] if face_encodings else None
+            self.cache.store(photo_path, encoding)
+        return encoding
+
+    def load(self, user_data):
+        """Rebuild the gallery from user records"""
+        with self.lock:
+            del self.ids[:]
+            del self.names[:]
+            self.positions.clear()
+            self.index.reset()
+
+            photo_paths = []
+            for user_id, user_info in user_data.items():
+                photo_path = user_info.get("photo_path")
+                if photo_path and os.path.exists(photo_path):
+                    photo_paths.append(photo_path)
+                    self.add(user_id, user_info["name"], photo_path)
+
+            self.cache.prune(photo_paths)
+            self.cache.save()
+
+    def add(self, user_id, name, photo_path):
+        """Encode a single user's photo and add them; returns False if no face was found"""
+        return self.replace(user_id, name, photo_path)
+
+    def remove(self, user_id):
+        """Remove a user from the gallery; returns False if they were not enrolled"""
+        with self.lock:
+            index = self.positions.pop(user_id, None)
+            if index is None:
+                return False
+
+            self.index.removed(index)
+
+            # Move the last entry into the hole so removal stays O(1)
+            last = len(self.ids) - 1
+            if index != last:
+                self.ids[index] = self.ids[last]
+                self.names[index] = self.names[last]
+                self._buffer[index] = self._buffer[last]
+                self._norms[index] = self._norms[last]
+                self.positions[self.ids[index]] = index
+                self.index.moved(last, index)
+
+            self.ids.pop()
+            self.names.pop()
+            return True
+
+    def replace(self, user_id, name, photo_path):
+        """Re-encode a user from a new photo, keeping their slot if already enrolled"""
+        # Encode outside the lock so recognition is not blocked meanwhile
+        encoding = self.encode_photo(photo_path)
+        if encoding is None:
+            self.remove(user_id)
+            return False
+
+        with self.lock:
+            index = self.positions.get(user_id)
+            if index is None:
+                index = len(self.ids)
+                self.positions[user_id] = index
+                self.ids.append(user_id)
+                self.names.append(name)
+            else:
+                self.index.removed(index)
+                self.names[index] = name
+
+            self._set_row(index, encoding)
+            self.index.added(index, self._buffer[index])
+            return True
+
+    def match(self, face_encodings, threshold=0.6):
+        """Match every face of a frame against the gallery in one batch.
+
+        Returns one FaceMatch per face with the closest user, its Euclidean
+        distance and the margin to the runner-up. user_id and name are None
+        when the closest distance is above threshold.
+        """
+        if len(face_encodings) == 0:
+            return []
+
+        queries = np.asarray(face_encodings, dtype=ENCODING_DTYPE).reshape(-1, ENCODING_SIZE)
+
+        with self.lock:
+            if not self.ids:
+                return [FaceMatch(None, None, float("inf"), float("inf"))] * len(queries)
+
+            distances, rows = self.index.search(
+                queries, self.matrix, self._norms[: len(self.ids)], k=2
+            )
+            ids = [self.ids[index] if index >= 0 else None for index in rows[:, 0]]
+            names = [self.names[index] if index >= 0 else None for index in rows[:, 0]]
+
+        matches = []
+        for (best, runner_up), user_id, name in zip(distances, ids, names):
+            distance, gap = float(best), float(runner_up - best)
+            if user_id is not None and distance <= threshold:
+                matches.append(FaceMatch(user_id, name, distance, gap))
+            else:
+                matches.append(FaceMatch(None, None, distance, gap))
+        return matches
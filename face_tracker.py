@@ -0,0 +1,148 @@
+import itertools
+import threading
+import time
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    intersection = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def box_center_distance(a, b):
+    """Distance between box centres relative to the size of box a"""
+    dy = (a[0] + a[2]) / 2 - (b[0] + b[2]) / 2
+    dx = (a[1] + a[3]) / 2 - (b[1] + b[3]) / 2
+    size = max(a[2] - a[0], a[1] - a[3], 1)
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+
+class Track:
+    """A face followed across frames, with the identity it was last matched to"""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.user_id = None
+        self.name = None
+        self.distance = None
+        self.created = now
+        self.last_verified = None
+        self.misses = 0
+
+
+class FaceTracker:
+    """Carries identities forward between frames so faces are not re-encoded every frame.
+
+    Boxes are associated with existing tracks greedily by IoU, falling back
+    to centre distance for fast movement. A box is only encoded and matched
+    when it starts a new track, when its identified track is due for
+    re-verification (every ``verify_interval`` seconds), or when its
+    unidentified track is due for a retry (every ``retry_interval``). Tracks that
+    go unseen for more than ``max_misses`` analysed frames are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.5, max_misses=5,
+                 verify_interval=3.0, retry_interval=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_misses = max_misses
+        self.verify_interval = verify_interval
+        self.retry_interval = retry_interval
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.frames = 0
+        self.faces = 0
+        self.encoded = 0
+        self.lock = threading.Lock()
+
+    def _associate(self, locations):
+        """Return the existing track for each box, or None where a new track is needed"""
+        pairs = []
+        for i, box in enumerate(locations):
+            for track in self.tracks:
+                iou = box_iou(box, track.box)
+                if iou >= self.iou_threshold:
+                    pairs.append((1.0 + iou, i, track))
+                else:
+                    distance = box_center_distance(track.box, box)
+                    if distance <= self.max_center_distance:
+                        pairs.append((1.0 - distance, i, track))
+
+        assigned = [None] * len(locations)
+        used = set()
+        for _, i, track in sorted(pairs, key=lambda pair: pair[0], reverse=True):
+            if assigned[i] is None and track.track_id not in used:
+                assigned[i] = track
+                used.add(track.track_id)
+        return assigned
+
+    def update(self, locations, encodings, match):
+        """Advance the tracker by one analysed frame.
+
+        ``encodings`` is indexed only for the boxes that need (re-)identifying,
+        so it may compute encodings lazily. ``match`` maps a list of encodings
+        to FaceMatch results. Returns ``(tracks, identified)`` where
+        identified holds a FaceMatch for every track that gained or changed
+        identity on this frame.
+        """
+        now = time.monotonic()
+        with self.lock:
+            assigned = self._associate(locations)
+
+            for i, track in enumerate(assigned):
+                if track is None:
+                    track = assigned[i] = Track(next(self.ids), locations[i], now)
+                    self.tracks.append(track)
+                track.box = locations[i]
+                track.misses = 0
+
+            pending = [
+                i for i, track in enumerate(assigned)
+                if track.last_verified is None
+                or now - track.last_verified >= (
+                    self.verify_interval if track.user_id else self.retry_interval
+                )
+            ]
+
+            identified = []
+            if pending:
+                for i, result in zip(pending, match([encodings[i] for i in pending])):
+                    track = assigned[i]
+                    track.last_verified = now
+                    if result.user_id is not None and result.user_id != track.user_id:
+                        track.user_id = result.user_id
+                        track.name = result.name
+                        identified.append(result)
+                    if result.user_id is not None:
+                        track.distance = result.distance
+
+            # Age out tracks that were not seen on this frame
+            seen = {track.track_id for track in assigned}
+            for track in self.tracks:
+                if track.track_id not in seen:
+                    track.misses += 1
+            self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+            self.frames += 1
+            self.faces += len(locations)
+            self.encoded += len(pending)
+            return list(self.tracks), identified
+
+    def reset(self):
+        with self.lock:
+            self.tracks = []
+
+    def stats(self):
+        """Track count and how many detected faces actually had to be encoded"""
+        with self.lock:
+            return {
+                "tracks": len(self.tracks),
+                "faces": self.faces,
+                "encoded": self.encoded,
+            }
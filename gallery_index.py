@@ -0,0 +1,258 @@
+import time
+
+import numpy as np
+
+from encoding_cache import ENCODING_DTYPE, ENCODING_SIZE
+
+
+def pairwise_distances(queries, candidates, candidate_norms):
+    """Euclidean distances between every query row and every candidate row"""
+    squared = (
+        np.einsum("ij,ij->i", queries, queries)[:, None]
+        + candidate_norms[None, :]
+        - 2.0 * (queries @ candidates.T)
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def top_k(distances, k):
+    """Return (distances, columns) of the k smallest entries per row, closest first.
+
+    Rows with fewer than k columns are padded with inf / -1.
+    """
+    rows, columns = distances.shape
+    out_distances = np.full((rows, k), np.inf, dtype=distances.dtype)
+    out_columns = np.full((rows, k), -1, dtype=np.intp)
+    if columns == 0:
+        return out_distances, out_columns
+
+    kept = min(k, columns)
+    if columns > kept:
+        nearest = np.argpartition(distances, kept - 1, axis=1)[:, :kept]
+    else:
+        nearest = np.tile(np.arange(columns), (rows, 1))
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    order = np.argsort(nearest_distances, axis=1)
+
+    out_columns[:, :kept] = np.take_along_axis(nearest, order, axis=1)
+    out_distances[:, :kept] = np.take_along_axis(nearest_distances, order, axis=1)
+    return out_distances, out_columns
+
+
+class BruteForceIndex:
+    """Exact search that compares every query against every enrolled encoding"""
+
+    name = "exact"
+
+    def reset(self):
+        pass
+
+    def added(self, row, vector):
+        pass
+
+    def removed(self, row):
+        pass
+
+    def moved(self, src, dst):
+        pass
+
+    def search(self, queries, matrix, norms, k=2):
+        """Return (distances, rows) of the k nearest gallery rows per query"""
+        return top_k(pairwise_distances(queries, matrix, norms), k)
+
+
+class IVFIndex:
+    """Approximate search over k-means partitions of the gallery (an inverted file).
+
+    Gallery rows are bucketed by their nearest centroid; a frame is only
+    compared against the rows in its faces' ``n_probe`` nearest buckets. Centroids
+    are trained lazily once the gallery reaches ``min_train`` rows and
+    retrained when it has doubled since; in between, added rows are simply
+    assigned to their nearest existing centroid. Smaller galleries are
+    searched exhaustively.
+    """
+
+    name = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=8, min_train=1024, iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train = min_train
+        self.iterations = iterations
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        self.centroids = None
+        self.trained_size = 0
+        self.members = []
+        self.arrays = []
+        self.assignment = {}
+        self.slot = {}
+
+    def _nearest_centroid(self, vectors):
+        norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        return np.argmin(pairwise_distances(vectors, self.centroids, norms), axis=1)
+
+    def _train(self, matrix):
+        n = len(matrix)
+        n_lists = self.n_lists or int(np.clip(np.sqrt(n), 16, 4096))
+        n_lists = min(n_lists, n)
+
+        # Lloyd iterations on a bounded sample keep training time predictable
+        sample_size = min(n, 256 * n_lists)
+        sample = matrix[self.rng.choice(n, sample_size, replace=False)]
+        centroids = sample[self.rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            self.centroids = centroids
+            labels = self._nearest_centroid(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids.astype(ENCODING_DTYPE)
+        self.trained_size = n
+        self.members = [[] for _ in range(n_lists)]
+        self.arrays = [None] * n_lists
+        self.assignment = {}
+        self.slot = {}
+
+        labels = np.empty(n, dtype=np.intp)
+        for start in range(0, n, 8192):
+            labels[start:start + 8192] = self._nearest_centroid(matrix[start:start + 8192])
+        for row, label in enumerate(labels):
+            self._insert(row, int(label))
+
+    def _bucket(self, label):
+        bucket = self.arrays[label]
+        if bucket is None:
+            bucket = self.arrays[label] = np.array(self.members[label], dtype=np.intp)
+        return bucket
+
+    def _insert(self, row, label):
+        self.assignment[row] = label
+        self.slot[row] = len(self.members[label])
+        self.members[label].append(row)
+        self.arrays[label] = None
+
+    def added(self, row, vector):
+        if self.centroids is not None:
+            label = int(self._nearest_centroid(np.asarray(vector, dtype=ENCODING_DTYPE)[None, :])[0])
+            self._insert(row, label)
+
+    def removed(self, row):
+        label = self.assignment.pop(row, None)
+        if label is None:
+            return
+
+        # Swap-remove within the bucket, keeping slots consistent
+        members = self.members[label]
+        slot = self.slot.pop(row)
+        last = members.pop()
+        if last != row:
+            members[slot] = last
+            self.slot[last] = slot
+        self.arrays[label] = None
+
+    def moved(self, src, dst):
+        label = self.assignment.pop(src, None)
+        if label is None:
+            return
+        slot = self.slot.pop(src)
+        self.members[label][slot] = dst
+        self.assignment[dst] = label
+        self.slot[dst] = slot
+        self.arrays[label] = None
+
+    def search(self, queries, matrix, norms, k=2):
+        """Return (distances, rows) of the approximately k nearest gallery rows per query"""
+        n = len(matrix)
+        if n < self.min_train:
+            return top_k(pairwise_distances(queries, matrix, norms), k)
+
+        if self.centroids is None or n >= 2 * self.trained_size:
+            self._train(matrix)
+
+        probes = min(self.n_probe, len(self.centroids))
+        centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        centroid_distances = pairwise_distances(queries, self.centroids, centroid_norms)
+        probed = np.argpartition(centroid_distances, probes - 1, axis=1)[:, :probes]
+
+        # Score the whole frame against the union of its probed buckets at once
+        candidates = np.concatenate([self._bucket(label) for label in np.unique(probed)])
+        if len(candidates) == 0:
+            # Every probed bucket has been emptied by removals since training
+            return top_k(pairwise_distances(queries, matrix, norms), k)
+        distances, columns = top_k(
+            pairwise_distances(queries, matrix[candidates], norms[candidates]), k
+        )
+        rows = np.where(columns >= 0, candidates[np.maximum(columns, 0)], -1)
+        return distances, rows
+
+
+GALLERY_INDEXES = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def create_index(name="exact", **options):
+    """Create a gallery index backend by name"""
+    try:
+        return GALLERY_INDEXES[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown gallery index: {name}")
+
+
+def benchmark_indexes(gallery_size=20000, query_count=1000, faces_per_frame=4, noise=0.03, seed=0):
+    """Compare recall@1 and per-frame latency of each backend against exact search.
+
+    Synthetic encodings are drawn around a few hundred identity clusters so the
+    data has structure for the partitioned index to exploit, and queries are
+    noisy copies of enrolled rows.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, 0.1, (max(gallery_size // 50, 1), ENCODING_SIZE))
+    matrix = (
+        centers[rng.integers(len(centers), size=gallery_size)]
+        + rng.normal(0.0, 0.05, (gallery_size, ENCODING_SIZE))
+    ).astype(ENCODING_DTYPE)
+    norms = np.einsum("ij,ij->i", matrix, matrix)
+    queries = (
+        matrix[rng.integers(gallery_size, size=query_count)]
+        + rng.normal(0.0, noise, (query_count, ENCODING_SIZE))
+    ).astype(ENCODING_DTYPE)
+
+    exact_rows = BruteForceIndex().search(queries, matrix, norms, k=1)[1][:, 0]
+
+    results = {}
+    for name, factory in GALLERY_INDEXES.items():
+        index = factory()
+        # Train outside the timed loop, as a running kiosk would have done already
+        index.search(queries[:1], matrix, norms, k=1)
+
+        found = np.empty(query_count, dtype=np.intp)
+        start = time.perf_counter()
+        for begin in range(0, query_count, faces_per_frame):
+            batch = queries[begin:begin + faces_per_frame]
+            found[begin:begin + len(batch)] = index.search(batch, matrix, norms, k=1)[1][:, 0]
+        elapsed = time.perf_counter() - start
+
+        frames = -(-query_count // faces_per_frame)
+        results[name] = {
+            "recall_at_1": float(np.mean(found == exact_rows)),
+            "ms_per_frame": 1000.0 * elapsed / frames,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for size in (1000, 10000, 50000):
+        for name, result in benchmark_indexes(gallery_size=size).items():
+            print(
+                f"{size:>6} enrolled  {name:<6} "
+                f"recall@1={result['recall_at_1']:.3f}  {result['ms_per_frame']:.2f} ms/frame"
+            )
@@ -5,11 +5,9 @@ from tkinter import ttk, messagebox
 import cv2
 from tkinter import messagebox
 import numpy as np
-import face_recognition
 import os
 from datetime import datetime, timedelta
 import json
-import pandas as pd
 from PIL import Image, ImageTk
 import threading
 import time
@@ -20,7 +18,20 @@ from dark_mode_utils import *
 import tkinter as tk
 from teacher_login import TeacherLogin
 import uuid
+from functools import partial
 from leave_management import *
+from encoding_cache import EncodingCache
+from export_jobs import ExportJob, date_range
+from attendance_journal import AttendanceJournal
+from attendance_storage import open_storage
+from attendance_writer import AttendanceWriter
+from backup_system import BACKUP_FREQUENCIES, BackupSystem
+from face_gallery import FaceGallery
+from gallery_index import create_index
+from camera_pipeline import AdaptiveScheduler, CameraPipeline, MotionGate
+from face_detection import FACE_DETECTORS, detect_faces
+from face_tracker import FaceTracker
+from recognition_pool import RecognitionEngine
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 # Set customtkinter appearance
@@ -53,30 +64,71 @@ class FaceAttendanceSystem:
         # Initialize variables
 
         self.camera = None
+        self.camera_pipeline = None
+        self.recognition_engine = None
+        self.face_tracker = FaceTracker()
         self.is_capturing = False
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_ids = []
         self.current_frame = None
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
         )
         self.settings = self.load_settings()
+        # JSON files or SQLite, as selected by "storage_backend"
+        self.storage = open_storage(
+            self.settings.get("storage_backend"), self.settings.get("database_path")
+        )
+        self.encoding_cache = EncodingCache()
 
+        # The Haar cascade proposes regions for the HOG detector when selected
+        detector_name = self.settings.get("face_detector", "hog")
+        if detector_name == "haar":
+            self.face_detector = FACE_DETECTORS["haar"](cascade=self.face_cascade)
+        else:
+            self.face_detector = FACE_DETECTORS[detector_name]()
 
-        # Load known faces
+        # The gallery mutates these lists in place
+        self.face_gallery = FaceGallery(
+            self.encoding_cache,
+            index=create_index(self.settings.get("gallery_index", "exact")),
+        )
+        self.known_face_names = self.face_gallery.names
+        self.known_face_ids = self.face_gallery.ids
 
-        self.load_known_faces()
 
-        # Create main UI
+        # Load known faces
 
-        self.create_widgets()
+        self.load_known_faces()
 
         # Initialize attendance dictionary
 
         self.today_attendance = {}
+        self.attendance_journal = AttendanceJournal(self.storage)
+
+        # Journal writes and compaction run on a background thread in batches
+        self.attendance_display_pending = False
+        self.attendance_writer = AttendanceWriter(self.attendance_journal)
+        self.attendance_writer.start()
+
+        # Report exports run on a background thread; the UI polls their progress
+        self.export_job = None
+
+        # Scheduled incremental snapshots replace the per-save backup files;
+        # created before the widgets, as the settings tab shows its settings
+        self.backup_system = BackupSystem(
+            self.settings.get("backup"),
+            before_backup=partial(self.attendance_writer.flush, compact=True),
+        )
+
+        # Create main UI
+
+        self.create_widgets()
         self.load_today_attendance()
 
+        self.backup_system.start()
+        self.schedule_attendance_archive()
+        self.user_refresh_thread = None
+        self.schedule_user_refresh()
+
         # Protocol for closing the window
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -121,12 +173,25 @@ class FaceAttendanceSystem:
             default_settings = {
                 "camera_index": 1,
                 "attendance_threshold": 0.6,
+                "gallery_index": "exact",
+                "recognition_workers": 0,
+                "motion_threshold": 0.02,
+                "face_detector": "hog",
+                "target_fps": 10,
                 "auto_capture": False,
                 "notification_enabled": True,
                 "working_hours": {"start": "09:00", "end": "17:00"},
                 "grace_period_minutes": 10,
                 "late_penalty_minutes": 1,
                 "timezone": "Asia/Baghdad",
+                "storage_backend": "json",
+                "database_path": "attendance.db",
+                "backup": {
+                    "backup_directory": "backups",
+                    "backup_frequency": "daily",
+                    "retention_days": 30,
+                    "enabled": True,
+                },
             }
             with open("settings.json", "w") as f:
                 json.dump(default_settings, f, indent=4)
@@ -161,21 +226,41 @@ class FaceAttendanceSystem:
     def load_known_faces(self):
         if not os.path.exists("face_data"):
             os.makedirs("face_data")
+        # Read the signature first, so a change made during the load is seen next time
+        self.users_signature = self.storage.users_signature()
+        self.user_data = self.storage.load_users()
+        self.face_gallery.load(self.user_data)
+
+    def refresh_known_faces(self):
+        """Enroll, update or drop users changed by other processes, such as the web app's /register"""
         try:
-            with open("user_records.json", "r") as f:
-                self.user_data = json.load(f)
-        except FileNotFoundError:
-            self.user_data = {}
-        for user_id, user_info in self.user_data.items():
-            if "photo_path" in user_info:
-                image_path = user_info["photo_path"]
-                if os.path.exists(image_path):
-                    image = face_recognition.load_image_file(image_path)
-                    face_encodings = face_recognition.face_encodings(image)
-                    if face_encodings:
-                        self.known_face_encodings.append(face_encodings[0])
-                        self.known_face_names.append(user_info["name"])
-                        self.known_face_ids.append(user_id)
+            signature = self.storage.users_signature()
+            if signature == self.users_signature:
+                return
+            users = self.storage.load_users()
+            # register_user adds to user_data on the UI thread meanwhile
+            previous = dict(self.user_data)
+            for user_id, info in users.items():
+                if previous.get(user_id) == info:
+                    continue
+                photo_path = info.get("photo_path")
+                if photo_path and os.path.exists(photo_path):
+                    self.face_gallery.replace(user_id, info["name"], photo_path)
+                else:
+                    self.face_gallery.remove(user_id)
+            for user_id in previous.keys() - users.keys():
+                self.face_gallery.remove(user_id)
+            self.user_data = users
+            self.users_signature = signature
+        except Exception as e:
+            print(f"Failed to refresh users: {e}")
+
+    def schedule_user_refresh(self):
+        """Check for users registered elsewhere every few seconds, off the UI thread"""
+        if self.user_refresh_thread is None or not self.user_refresh_thread.is_alive():
+            self.user_refresh_thread = threading.Thread(target=self.refresh_known_faces, daemon=True)
+            self.user_refresh_thread.start()
+        self.root.after(5000, self.schedule_user_refresh)
 
     def validate_date(self, date_str):
         try:
@@ -243,7 +328,7 @@ class FaceAttendanceSystem:
 
         ctk.CTkLabel(backup_frame, text="Backup Frequency:").pack()
         self.backup_freq = ttk.Combobox(backup_frame,
-                                        values=["daily", "weekly", "monthly"],
+                                        values=list(BACKUP_FREQUENCIES),
                                         state="readonly")
         self.backup_freq.set(self.backup_system.settings['backup_frequency'])
         self.backup_freq.pack()
@@ -259,16 +344,19 @@ class FaceAttendanceSystem:
             self.backup_enabled.select()
 
         backup_now_btn = ctk.CTkButton(backup_frame, text="Backup Now",
-                                       command=self.backup_system.create_backup)
+                                       command=self.backup_now)
         backup_now_btn.pack(pady=5)
 
         restore_btn = ctk.CTkButton(backup_frame, text="Restore Backup",
                                     command=self.show_restore_dialog)
         restore_btn.pack(pady=5)
 
+    def backup_now(self):
+        """Take a snapshot off the UI thread; hashing the data files can take a while"""
+        threading.Thread(target=self.backup_system.create_backup, daemon=True).start()
+
     def show_restore_dialog(self):
-        backup_dir = self.backup_system.settings['backup_directory']
-        backups = [f for f in os.listdir(backup_dir) if f.startswith('backup_')]
+        backups = self.backup_system.manifests()
 
         if not backups:
             messagebox.showinfo("Info", "No backups available")
@@ -296,11 +384,21 @@ class FaceAttendanceSystem:
             backup_file = backup_list.get(selection[0])
             if messagebox.askyesno("Confirm Restore",
                                    "This will overwrite current data. Continue?"):
+                # Fold pending marks in first so the journal cannot replay over the restore
+                was_capturing = self.is_capturing
+                if was_capturing:
+                    self.toggle_camera()
+                self.attendance_writer.flush(compact=True)
+                self.backup_system.stop()
                 if self.backup_system.restore_backup(backup_file):
                     messagebox.showinfo("Success", "Backup restored successfully")
                     dialog.destroy()
                     self.root.destroy()  # Restart app to load restored data
                 else:
+                    # Nothing was replaced, so carry on as before
+                    self.backup_system.start()
+                    if was_capturing:
+                        self.toggle_camera()
                     messagebox.showerror("Error", "Failed to restore backup")
 
         ctk.CTkButton(dialog, text="Restore", command=do_restore).pack(pady=10)
@@ -315,17 +413,13 @@ class FaceAttendanceSystem:
 
                     if current_time > start_time:
                         current_date = datetime.now().strftime("%Y-%m-%d")
-                        try:
-                            with open(f"attendance_{current_date}.json", "r") as f:
-                                data = json.load(f)
-                                for user_id, info in self.user_data.items():
-                                    if user_id not in data.get(current_date, {}):
-                                        messagebox.showwarning(
-                                            "Late Arrival",
-                                            f"{info['name']} has not arrived yet!",
-                                        )
-                        except FileNotFoundError:
-                            pass
+                        data = self.load_attendance_day(current_date)
+                        for user_id, info in self.user_data.items():
+                            if user_id not in data[current_date]:
+                                messagebox.showwarning(
+                                    "Late Arrival",
+                                    f"{info['name']} has not arrived yet!",
+                                )
                 time.sleep(300)  # Check every 5 minutes
 
         # Start notification thread
@@ -375,6 +469,12 @@ class FaceAttendanceSystem:
         )
         self.camera_button.pack(pady=10)
 
+        # Pipeline counters, useful for tuning the motion threshold
+        self.camera_stats_label = ctk.CTkLabel(left_frame, text="")
+        self.camera_stats_label.pack(pady=5)
+        self.camera_schedule_label = ctk.CTkLabel(left_frame, text="")
+        self.camera_schedule_label.pack(pady=5)
+
         # Attendance display
         header_frame = ctk.CTkFrame(right_frame)
         header_frame.pack(fill="x", pady=10)
@@ -507,9 +607,7 @@ class FaceAttendanceSystem:
                 for user_id in selected_ids:
                     if str(user_id) in self.today_attendance[current_date]:
                         del self.today_attendance[current_date][str(user_id)]
-
-            # Save updated attendance
-            self.save_attendance()
+                        self.attendance_writer.submit(current_date, "delete", str(user_id))
 
             # Update display
             self.update_attendance_display()
@@ -543,9 +641,7 @@ class FaceAttendanceSystem:
         try:
             # Clear today's attendance
             self.today_attendance[current_date] = {}
-
-            # Save empty attendance
-            self.save_attendance()
+            self.attendance_writer.submit(current_date, "clear")
 
             # Update display
             self.update_attendance_display()
@@ -696,15 +792,8 @@ class FaceAttendanceSystem:
 
             while current <= current_date:
                 date_str = current.strftime("%Y-%m-%d")
-                filename = f"attendance_{date_str}.json"
-
-                try:
-                    with open(filename, "r") as f:
-                        attendance_data = json.load(f)
-                        if date_str in attendance_data and str(user_id) in attendance_data[date_str]:
-                            attended_days += 1
-                except FileNotFoundError:
-                    pass
+                if str(user_id) in self.load_attendance_day(date_str)[date_str]:
+                    attended_days += 1
 
                 current += timedelta(days=1)
 
@@ -761,56 +850,123 @@ class FaceAttendanceSystem:
                     "Could not open camera. Try index 0 or check camera connection.",
                 )
                 return
+            # Keep the driver from queueing stale frames
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+            # Spread detection over worker processes when configured
+            workers = self.settings.get("recognition_workers", 0)
+            if workers > 0 and self.recognition_engine is None:
+                self.recognition_engine = RecognitionEngine(
+                    workers, detect_options={"detector": self.face_detector.name}
+                )
+                self.recognition_engine.start()
+
+            motion_gate = MotionGate(threshold=self.settings.get("motion_threshold", 0.02))
+            self.frame_scheduler = AdaptiveScheduler(
+                target_fps=self.settings.get("target_fps", 10)
+            )
+            # Encode lazily so the tracker only pays for faces it must identify
+            self.face_tracker.reset()
+            self.camera_pipeline = CameraPipeline(
+                self.camera,
+                partial(detect_faces, lazy=True, detector=self.face_detector),
+                self.annotate_frame,
+                self.recognition_engine, motion_gate, self.frame_scheduler,
+            )
+            self.camera_pipeline.start()
             self.is_capturing = True
             self.camera_button.configure(text="Stop Camera")
             self.update_camera()
         else:
-            self.camera.release()
-            self.is_capturing = False
+            self.stop_camera()
             self.camera_button.configure(text="Start Camera")
             self.camera_label.configure(image=None)
+            self.camera_stats_label.configure(text="")
+            self.camera_schedule_label.configure(text="")
 
-    def update_camera(self):
-        if self.is_capturing:
-            ret, frame = self.camera.read()
-            if ret:
-                # Face recognition process
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = small_frame[:, :, ::-1]
+    def stop_camera(self):
+        self.is_capturing = False
+        if self.camera_pipeline is not None:
+            self.camera_pipeline.stop()
+            self.camera_pipeline = None
+        # In-flight frames belong to the stopped pipeline, so the workers go with it
+        if self.recognition_engine is not None:
+            self.recognition_engine.stop()
+            self.recognition_engine = None
+        self.face_tracker = FaceTracker()
+        if self.camera is not None:
+            self.camera.release()
 
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(
-                    rgb_small_frame, face_locations
-                )
+    def annotate_frame(self, frame, face_locations, face_encodings):
+        """Track, identify and draw faces on the frame; runs off the Tk thread"""
+        if face_locations is None:
+            # Frame skipped by the motion gate: keep showing the current tracks
+            tracks, identified = self.face_tracker.tracks, []
+        else:
+            tracks, identified = self.face_tracker.update(
+                face_locations,
+                face_encodings,
+                lambda encodings: self.face_gallery.match(
+                    encodings, self.settings["attendance_threshold"]
+                ),
+            )
 
-                # Draw rectangles around faces
-                for top, right, bottom, left in face_locations:
-                    top *= 4
-                    right *= 4
-                    bottom *= 4
-                    left *= 4
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-
-                # Process each face found
-                for face_encoding in face_encodings:
-                    matches = face_recognition.compare_faces(
-                        self.known_face_encodings, face_encoding
-                    )
-                    if True in matches:
-                        first_match_index = matches.index(True)
-                        user_id = self.known_face_ids[first_match_index]
-                        name = self.known_face_names[first_match_index]
-                        self.mark_attendance(user_id, name)
+        # Draw rectangles around faces
+        for track in tracks:
+            if track.misses:
+                continue
+            top, right, bottom, left = track.box
+            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+            if track.name:
+                cv2.putText(frame, track.name, (left, max(top - 10, 0)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        image = Image.fromarray(frame)
+        image = image.resize((640, 480))
+        return image, identified
 
-                # Display frame
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                image = Image.fromarray(frame)
-                image = image.resize((640, 480))
+    def update_camera(self):
+        """Blit the latest annotated frame and mark attendance on the Tk thread"""
+        if self.is_capturing:
+            for match in self.camera_pipeline.pending_matches():
+                self.mark_attendance(match.user_id, match.name)
+
+            image = self.camera_pipeline.latest_image()
+            if image is not None:
                 photo = ImageTk.PhotoImage(image=image)
                 self.camera_label.configure(image=photo)
                 self.camera_label.image = photo
+                self.update_camera_stats()
+
+            self.root.after(15, self.update_camera)
+
+    def update_camera_stats(self):
+        stats = self.camera_pipeline.stats()
+        tracker_stats = self.face_tracker.stats()
+        writer_metrics = self.attendance_writer.metrics()
+        self.camera_stats_label.configure(
+            text=f"Frames: {stats['captured']}  "
+                 f"Recognized: {stats.get('processed', 0)}  "
+                 f"Skipped (no motion): {stats.get('gated', 0)}  "
+                 f"Change: {stats.get('last_score', 0.0):.1%}\n"
+                 f"Tracks: {tracker_stats['tracks']}  "
+                 f"Faces encoded: {tracker_stats['encoded']} of {tracker_stats['faces']}  "
+                 f"Write queue: {writer_metrics['queue_depth']}  "
+                 f"Flush: {writer_metrics['last_flush_ms']:.1f} ms "
+                 f"(max {writer_metrics['max_flush_ms']:.1f} ms)"
+        )
 
-            self.root.after(10, self.update_camera)
+        # Show what the scheduler chose and why, so throughput changes are explainable
+        decisions = stats["scheduler"]
+        latency = decisions["latency_ms"]
+        self.camera_schedule_label.configure(
+            text=f"Scale: {decisions['scale']}  "
+                 f"Analyse every {decisions['interval']} frame(s)  "
+                 f"Upsample: {decisions['upsample']}  "
+                 f"Latency: {f'{latency:.0f} ms' if latency is not None else 'n/a'}\n"
+                 f"{decisions['reason']}"
+        )
 
     def setup_registration_tab(self):
         # Create main frame
@@ -928,12 +1084,16 @@ class FaceAttendanceSystem:
                     ).seconds // 60
                     status = f"Late by {minutes_late} minutes"
 
-                self.today_attendance[current_date][user_id] = {
+                record = {
                     "name": name,
                     "time": current_time,
                     "status": status,
                     "timezone": "Asia/Baghdad",
                 }
+                self.today_attendance[current_date][user_id] = record
+
+                # Queued for the background writer, which batches journal writes
+                self.attendance_writer.submit(current_date, "mark", user_id, record)
 
                 # Show notification for attendance
                 messagebox.showinfo(
@@ -945,8 +1105,7 @@ class FaceAttendanceSystem:
                     f"Time Zone: Baghdad (UTC+3)",
                 )
 
-                self.update_attendance_display()
-                self.save_attendance()
+                self.schedule_attendance_display()
 
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to mark attendance: {str(e)}")
@@ -1012,13 +1171,18 @@ class FaceAttendanceSystem:
             }
 
             # Save user records
-            with open("user_records.json", "w") as f:
-                json.dump(self.user_data, f, indent=4)
+            self.storage.save_user(user_id, self.user_data[user_id])
 
-            # Reload known faces
-            self.load_known_faces()
+            # Encode only the new user instead of reloading the whole gallery
+            face_found = self.face_gallery.add(user_id, name, permanent_photo_path)
 
             messagebox.showinfo("Success", f"User registered successfully\nID: {user_id}")
+            if not face_found:
+                messagebox.showwarning(
+                    "Warning",
+                    "No face was detected in the captured photo. "
+                    "This user will not be recognized until a new photo is registered.",
+                )
 
             # Clear form
             self.reg_name.delete(0, ctk.END)
@@ -1043,35 +1207,32 @@ class FaceAttendanceSystem:
                     values=(user_id, data["name"], data["time"], data["status"]),
                 )
 
-    def save_attendance(self):
-        filename = f"attendance_{self.get_current_time().strftime('%Y-%m-%d')}.json"
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.today_attendance, f, indent=4)
+    def schedule_attendance_display(self):
+        """Refresh the attendance table once for a burst of marks"""
+        if not self.attendance_display_pending:
+            self.attendance_display_pending = True
+            self.root.after(250, self.refresh_attendance_display)
 
-            # Create backup
-            backup_dir = "attendance_backups"
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
+    def refresh_attendance_display(self):
+        self.attendance_display_pending = False
+        self.update_attendance_display()
 
-            backup_filename = os.path.join(
-                backup_dir,
-                f"backup_attendance_{self.get_current_time().strftime('%Y-%m-%d_%H-%M-%S')}.json"
-            )
-            with open(backup_filename, "w") as f:
-                json.dump(self.today_attendance, f, indent=4)
+    def schedule_attendance_archive(self):
+        """Roll closed days into the monthly archive, off the UI thread, every hour"""
+        today = self.get_current_time().strftime("%Y-%m-%d")
+        threading.Thread(
+            target=self.storage.archive_closed_days, args=(today,), daemon=True
+        ).start()
+        self.root.after(3600000, self.schedule_attendance_archive)
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save attendance: {str(e)}")
+    def load_attendance_day(self, date):
+        """Return {date: entries} for any date, including marks not yet compacted"""
+        return self.attendance_journal.load_day(date)
 
     def load_today_attendance(self):
         current_date = datetime.now().strftime("%Y-%m-%d")
-        filename = f"attendance_{current_date}.json"
-        try:
-            with open(filename, "r") as f:
-                self.today_attendance = json.load(f)
-        except FileNotFoundError:
-            self.today_attendance = {current_date: {}}
+        # Snapshot plus journal tail, which recovers marks made before a crash
+        self.today_attendance = self.attendance_journal.load_day(current_date)
         self.update_attendance_display()
 
     def setup_settings_tab(self):
@@ -1171,6 +1332,8 @@ class FaceAttendanceSystem:
         self.grace_period.insert(0, str(self.settings.get("grace_period_minutes", 10)))
         self.grace_period.pack(side="left", padx=5)
 
+        self.setup_backup_settings(settings_frame)
+
         # Save settings button
         save_button = ctk.CTkButton(
             settings_frame,
@@ -1235,6 +1398,30 @@ class FaceAttendanceSystem:
             date_frame, text="Export Report...", command=self.export_records, width=120
         ).pack(side="left", padx=5)
 
+        # Optional range and departments for exports; blank means the selected date, all departments
+        export_frame = ctk.CTkFrame(main_frame)
+        export_frame.pack(pady=5)
+
+        ctk.CTkLabel(export_frame, text="Export to date:").pack(side="left", padx=5)
+        self.export_to_entry = ctk.CTkEntry(export_frame, width=110, placeholder_text="YYYY-MM-DD")
+        self.export_to_entry.pack(side="left", padx=5)
+
+        ctk.CTkLabel(export_frame, text="Departments:").pack(side="left", padx=5)
+        self.export_departments_entry = ctk.CTkEntry(export_frame, width=200, placeholder_text="All (comma-separated)")
+        self.export_departments_entry.pack(side="left", padx=5)
+
+        self.export_progress = ctk.CTkProgressBar(export_frame, width=150)
+        self.export_progress.set(0)
+        self.export_progress.pack(side="left", padx=5)
+
+        self.export_status_label = ctk.CTkLabel(export_frame, text="")
+        self.export_status_label.pack(side="left", padx=5)
+
+        self.export_cancel_button = ctk.CTkButton(
+            export_frame, text="Cancel", command=self.cancel_export, width=80, state="disabled"
+        )
+        self.export_cancel_button.pack(side="left", padx=5)
+
         # Records display
         columns = ("ID", "Name", "Time", "Status")
         self.records_tree = self.create_treeview(main_frame, columns)
@@ -1249,22 +1436,15 @@ class FaceAttendanceSystem:
         current_date = from_date
         while current_date <= to_date:
             date_str = current_date.strftime("%Y-%m-%d")
-            try:
-                with open(f"attendance_{date_str}.json", "r") as f:
-                    data = json.load(f)
-                    daily_data = data.get(date_str, {})
+            daily_data = self.load_attendance_day(date_str)[date_str]
 
-                    attendance_data["total"][date_str] = len(daily_data)
-                    attendance_data["on_time"][date_str] = len(
-                        [x for x in daily_data.values() if x["status"] == "On Time"]
-                    )
-                    attendance_data["late"][date_str] = len(
-                        [x for x in daily_data.values() if "Late" in x["status"]]
-                    )
-            except FileNotFoundError:
-                attendance_data["total"][date_str] = 0
-                attendance_data["on_time"][date_str] = 0
-                attendance_data["late"][date_str] = 0
+            attendance_data["total"][date_str] = len(daily_data)
+            attendance_data["on_time"][date_str] = len(
+                [x for x in daily_data.values() if x["status"] == "On Time"]
+            )
+            attendance_data["late"][date_str] = len(
+                [x for x in daily_data.values() if "Late" in x["status"]]
+            )
             current_date += timedelta(days=1)
 
         # Create matplotlib figure
@@ -1389,156 +1569,95 @@ class FaceAttendanceSystem:
                         )
                     )
     def export_records(self):
+        """Export the selected date, or a range, to Excel on a background job"""
         from tkinter import filedialog
-        import os
-        import platform
 
-        selected_date = self.date_entry.get()
-        filename = f"attendance_{selected_date}.json"
+        if self.export_job is not None and self.export_job.is_running():
+            messagebox.showinfo("Export", "An export is already running")
+            return
 
-        try:
-            # Ask user for save location
-            default_filename = f"attendance_report_{selected_date}.xlsx"
-            export_filename = filedialog.asksaveasfilename(
-                initialfile=default_filename,
-                defaultextension=".xlsx",
-                filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")],
-                title="Save Attendance Report As"
-            )
+        from_date = self.date_entry.get()
+        to_date = self.export_to_entry.get().strip() or from_date
+        if not self.validate_date(from_date) or not self.validate_date(to_date):
+            messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+            return
+        if to_date < from_date:
+            messagebox.showerror("Error", "The export end date is before the start date")
+            return
+        departments = [
+            department.strip()
+            for department in self.export_departments_entry.get().split(",")
+            if department.strip()
+        ]
 
-            # If user cancels the file dialog
-            if not export_filename:
-                return
+        # Ask user for save location
+        if to_date == from_date:
+            default_filename = f"attendance_report_{from_date}.xlsx"
+        else:
+            default_filename = f"attendance_report_{from_date}_to_{to_date}.xlsx"
+        export_filename = filedialog.asksaveasfilename(
+            initialfile=default_filename,
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")],
+            title="Save Attendance Report As"
+        )
 
-            # Read attendance data
-            with open(filename, "r") as f:
-                attendance_data = json.load(f)
-
-            # Create a more detailed DataFrame
-            data = []
-            for user_id, record in attendance_data[selected_date].items():
-                department = self.user_data.get(user_id, {}).get('department', 'N/A')
-
-                minutes_late = 0
-                if "Late by" in record["status"]:
-                    minutes_late = int(record["status"].split("Late by ")[1].split(" ")[0])
-
-                data.append({
-                    'ID': user_id,
-                    'Name': record['name'],
-                    'Department': department,
-                    'Time': record['time'],
-                    'Status': record['status'],
-                    'Minutes Late': minutes_late,
-                    'Date': selected_date,
-                    'Time Zone': record.get('timezone', 'Asia/Baghdad')
-                })
-
-            df = pd.DataFrame(data)
-
-            with pd.ExcelWriter(export_filename, engine='xlsxwriter') as writer:
-                # Write the main data
-                df.to_excel(writer, sheet_name='Attendance', index=False)
-
-                workbook = writer.book
-                worksheet = writer.sheets['Attendance']
-
-                # Add formats
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'align': 'center',
-                    'bg_color': '#D3D3D3',
-                    'border': 1
-                })
-
-                cell_format = workbook.add_format({
-                    'align': 'center',
-                    'border': 1
-                })
-
-                # Format the header
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # Format all cells
-                for row in range(len(df)):
-                    for col in range(len(df.columns)):
-                        worksheet.write(row + 1, col, df.iloc[row, col], cell_format)
-
-                # Adjust column widths
-                for i, col in enumerate(df.columns):
-                    max_length = max(
-                        df[col].astype(str).apply(len).max(),
-                        len(str(col))
-                    )
-                    worksheet.set_column(i, i, max_length + 2)
-
-                # Add summary statistics
-                summary_data = {
-                    'Total Entries': len(df),
-                    'On Time': len(df[df['Status'] == 'On Time']),
-                    'Within Grace Period': len(df[df['Status'] == 'Within Grace Period']),
-                    'Late': len(df[df['Status'].str.contains('Late', na=False)]),
-                    'Average Minutes Late': df['Minutes Late'].mean()
-                }
+        # If user cancels the file dialog
+        if not export_filename:
+            return
 
-                # Write summary to new worksheet
-                summary_df = pd.DataFrame(list(summary_data.items()),
-                                          columns=['Metric', 'Value'])
-                summary_df.to_excel(writer, sheet_name='Summary', index=False)
-
-                # Format summary sheet
-                summary_sheet = writer.sheets['Summary']
-                summary_sheet.set_column('A:A', 20)
-                summary_sheet.set_column('B:B', 15)
-
-                # Add charts
-                chart_sheet = workbook.add_worksheet('Analytics')
-
-                # Create pie chart for attendance status
-                pie_chart = workbook.add_chart({'type': 'pie'})
-                status_summary = df['Status'].value_counts()
-                pie_chart.add_series({
-                    'name': 'Attendance Status',
-                    'categories': ['Summary', 1, 0, 4, 0],
-                    'values': ['Summary', 1, 1, 4, 1],
-                })
-                pie_chart.set_title({'name': 'Attendance Status Distribution'})
-                chart_sheet.insert_chart('A2', pie_chart)
-
-                # Create bar chart for departmental analysis
-                dept_summary = df.groupby('Department').size().reset_index(name='Count')
-                dept_summary.to_excel(writer, sheet_name='DeptAnalysis', index=False)
-
-                bar_chart = workbook.add_chart({'type': 'column'})
-                bar_chart.add_series({
-                    'name': 'Department Attendance',
-                    'categories': '=DeptAnalysis!$A$2:$A$' + str(len(dept_summary) + 1),
-                    'values': '=DeptAnalysis!$B$2:$B$' + str(len(dept_summary) + 1),
-                })
-                bar_chart.set_title({'name': 'Attendance by Department'})
-                chart_sheet.insert_chart('A18', bar_chart)
-
-            # Open the containing folder and select the file
-            export_dir = os.path.dirname(export_filename)
-            if platform.system() == "Windows":
-                os.system(f'explorer /select,"{export_filename}"')
-            elif platform.system() == "Darwin":  # macOS
-                os.system(f'open -R "{export_filename}"')
-            else:  # Linux
-                os.system(f'xdg-open "{export_dir}"')
+        self.export_job = ExportJob(
+            export_filename,
+            date_range(from_date, to_date),
+            self.load_attendance_day,
+            self.user_data,
+            departments,
+        ).start()
+        self.export_cancel_button.configure(state="normal")
+        self.poll_export_job()
+
+    def cancel_export(self):
+        if self.export_job is not None:
+            self.export_job.cancel()
+
+    def poll_export_job(self):
+        import os
+        import platform
 
-            messagebox.showinfo("Success",
-                                f"Report exported successfully!\n"
-                                f"Location: {export_filename}\n"
-                                f"Total records: {len(df)}\n"
-                                f"Sheets included: Attendance, Summary, Analytics"
-                                )
+        job = self.export_job
+        stage, fraction = job.status()
+        self.export_progress.set(fraction)
+        self.export_status_label.configure(text=f"{stage} {fraction:.0%}")
+        if job.is_running():
+            self.root.after(100, self.poll_export_job)
+            return
 
-        except FileNotFoundError:
-            messagebox.showerror("Error", "No records found for selected date")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export records: {str(e)}")
+        self.export_cancel_button.configure(state="disabled")
+        if stage == "Cancelled":
+            self.export_status_label.configure(text="Export cancelled")
+            return
+        if job.error is not None:
+            self.export_status_label.configure(text="Export failed")
+            messagebox.showerror("Error", f"Failed to export records: {job.error}")
+            return
+
+        # Open the containing folder and select the file
+        export_filename = job.filename
+        export_dir = os.path.dirname(export_filename)
+        if platform.system() == "Windows":
+            os.system(f'explorer /select,"{export_filename}"')
+        elif platform.system() == "Darwin":  # macOS
+            os.system(f'open -R "{export_filename}"')
+        else:  # Linux
+            os.system(f'xdg-open "{export_dir}"')
+
+        messagebox.showinfo("Success",
+                            f"Report exported successfully!\n"
+                            f"Location: {export_filename}\n"
+                            f"Total records: {job.rows}\n"
+                            f"Sheets included: {', '.join(job.sheets)}, Summary, Analytics\n"
+                            f"Time: {job.elapsed:.1f}s"
+                            )
 
     def open_exports_folder(self):
         import os
@@ -1568,14 +1687,11 @@ class FaceAttendanceSystem:
             messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
             return
 
-        filename = f"attendance_{selected_date}.json"
-
         for item in self.records_tree.get_children():
             self.records_tree.delete(item)
 
         try:
-            with open(filename, "r") as f:
-                attendance_data = json.load(f)
+            attendance_data = self.load_attendance_day(selected_date)
 
             if selected_date not in attendance_data or not attendance_data[selected_date]:
                 messagebox.showinfo("Info", "No records found for selected date")
@@ -1587,8 +1703,6 @@ class FaceAttendanceSystem:
                     "end",
                     values=(user_id, data["name"], data["time"], data["status"]),
                 )
-        except FileNotFoundError:
-            messagebox.showinfo("Info", "No records found for selected date")
         except Exception as e:
             messagebox.showerror("Error", f"Error loading records: {str(e)}")
 
@@ -1645,17 +1759,32 @@ class FaceAttendanceSystem:
             settings_to_save["notification_enabled"] = True  # Default notification setting
             settings_to_save["timezone"] = "Asia/Baghdad"  # Default timezone
 
-            # 5. Save all settings to main settings file
+            # 5. Backup Settings
+            try:
+                retention_days = int(self.retention_days.get())
+                if retention_days < 1:
+                    raise ValueError("Retention must be at least one day")
+                backup_directory = self.backup_dir.get().strip()
+                if not backup_directory:
+                    raise ValueError("Backup directory must not be empty")
+                settings_to_save["backup"] = {
+                    "backup_directory": backup_directory,
+                    "backup_frequency": self.backup_freq.get(),
+                    "retention_days": retention_days,
+                    "enabled": bool(self.backup_enabled.get()),
+                }
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid backup settings: {str(e)}")
+                return False
+
+            # 6. Save all settings to main settings file
             try:
                 self.settings.update(settings_to_save)
                 with open("settings.json", "w") as f:
                     json.dump(self.settings, f, indent=4)
 
-                # Create a backup of settings
-                backup_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_file = f"settings_backup_{backup_time}.json"
-                with open(backup_file, "w") as f:
-                    json.dump(self.settings, f, indent=4)
+                # Earlier versions are kept by the scheduled snapshots
+                self.backup_system.settings.update(settings_to_save["backup"])
 
                 # Log the settings change
                 self.log_settings_change(self.settings)
@@ -1695,8 +1824,14 @@ class FaceAttendanceSystem:
             print(f"Failed to log settings change: {str(e)}")
 
     def on_closing(self):
-        if self.camera is not None:
-            self.camera.release()
+        self.stop_camera()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        # Stopping the writer flushes the queue and compacts the journal
+        self.attendance_writer.stop()
+        self.attendance_journal.close()
+        self.backup_system.stop()
+        self.encoding_cache.save()
         self.root.destroy()
 
     # Main execution
@@ -0,0 +1,178 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from face_detection import DEFAULT_SCALE, detect_faces, lazy_encodings
+
+RecognitionResult = namedtuple(
+    "RecognitionResult",
+    ["sequence", "slot", "frame", "locations", "small_locations", "scale", "elapsed", "error"],
+)
+
+
+def recognition_worker_main(tasks, results, detect_options):
+    """Worker process loop: detect faces in frames read from shared memory.
+
+    Only boxes come back; encoding is left to the parent, which computes it
+    just for the faces its tracker needs to identify.
+    """
+    segments = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            sequence, slot, name, shape, dtype, options = task
+            segment = segments.get(name)
+            if segment is None:
+                # Spawned workers share the parent's resource tracker, which
+                # stays responsible for unlinking the segment
+                segment = segments[name] = shared_memory.SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+            options = {**detect_options, **options, "lazy": True}
+            scale = options.setdefault("scale", DEFAULT_SCALE)
+            start = time.perf_counter()
+            try:
+                locations, encodings = detect_faces(frame, **options)
+                results.put((
+                    sequence, slot, locations, encodings.small_locations, scale,
+                    time.perf_counter() - start, None,
+                ))
+            except Exception as e:
+                results.put((sequence, slot, [], [], scale, time.perf_counter() - start, str(e)))
+            del frame
+    finally:
+        for segment in segments.values():
+            segment.close()
+
+
+class RecognitionEngine:
+    """Fans camera frames out to a pool of worker processes for face detection.
+
+    Frames are copied once into a ring of shared-memory slots and only the
+    slot name travels over the task queue, so nothing large is pickled.
+    Results come back in submission order; the caller must ``release`` each
+    result once it is done with the frame view so the slot can be reused.
+    Workers return boxes only, and ``encodings`` encodes them lazily in this
+    process, so a face tracker's savings apply here too.
+    """
+
+    def __init__(self, workers=2, slots_per_worker=2, detect_options=None):
+        self.workers = workers
+        self.slot_count = workers * slots_per_worker
+        self.detect_options = detect_options or {}
+        self.context = mp.get_context("spawn")
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = []
+        self.segments = []
+        self.frame_shape = None
+        self.frame_dtype = None
+        self.free_slots = queue.Queue()
+        self.pending = {}
+        self.next_sequence = 0
+        self.next_result_sequence = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            process = self.context.Process(
+                target=recognition_worker_main,
+                args=(self.tasks, self.results, self.detect_options),
+                name=f"recognition-worker-{i}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+    def _allocate(self, frame):
+        """(Re)create the shared-memory ring for frames of this shape"""
+        self._release_segments()
+        self.frame_shape = frame.shape
+        self.frame_dtype = frame.dtype
+        self.segments = [
+            shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            for _ in range(self.slot_count)
+        ]
+        self.free_slots = queue.Queue()
+        for slot in range(self.slot_count):
+            self.free_slots.put(slot)
+
+    def _view(self, slot):
+        return np.ndarray(self.frame_shape, dtype=self.frame_dtype, buffer=self.segments[slot].buf)
+
+    def submit(self, frame, timeout=None, options=None):
+        """Copy a frame into a free slot and queue it; returns False if no slot freed up in time.
+
+        ``options`` are extra keyword arguments for detect_faces on this frame only.
+        """
+        with self.lock:
+            if frame.shape != self.frame_shape or frame.dtype != self.frame_dtype:
+                # Only safe once every outstanding frame has been collected
+                if self.free_slots.qsize() != len(self.segments):
+                    return False
+                self._allocate(frame)
+
+        try:
+            slot = self.free_slots.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        self._view(slot)[...] = frame
+        with self.lock:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+        self.tasks.put(
+            (
+                sequence, slot, self.segments[slot].name, self.frame_shape,
+                self.frame_dtype.str, options or {},
+            )
+        )
+        return True
+
+    def next_result(self, timeout=None):
+        """Return the next RecognitionResult in submission order, or None on timeout"""
+        while self.next_result_sequence not in self.pending:
+            try:
+                result = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            self.pending[result[0]] = result[1:]
+
+        sequence = self.next_result_sequence
+        self.next_result_sequence += 1
+        slot, locations, small_locations, scale, elapsed, error = self.pending.pop(sequence)
+        return RecognitionResult(
+            sequence, slot, self._view(slot), locations, small_locations, scale, elapsed, error
+        )
+
+    def encodings(self, frame, result):
+        """LazyEncodings for a result's boxes over ``frame``, a copy of its slot's frame"""
+        return lazy_encodings(frame, result.small_locations, result.scale)
+
+    def release(self, result):
+        """Hand a result's frame slot back for reuse"""
+        self.free_slots.put(result.slot)
+
+    def _release_segments(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+    def stop(self, timeout=2.0):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self._release_segments()
@@ -0,0 +1,113 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class DataVersion:
+    """Monotonic counter that moves whenever attendance or users change.
+
+    ``watch`` registers ``bump`` as a listener on an AttendanceIndex and a
+    UserRegistry, so every indexed mark and every user add, change or
+    removal advances it. Anything keyed on the version is stale as soon as
+    the value moves on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def bump(self, *change):
+        with self.lock:
+            self.value += 1
+
+    def watch(self, attendance_index=None, user_registry=None):
+        if attendance_index is not None:
+            attendance_index.add_listener(self.bump)
+        if user_registry is not None:
+            user_registry.add_listener(self.bump)
+        return self
+
+
+def strong_etag(body):
+    """Strong validator for a response body (bytes)"""
+    return hashlib.sha256(body).hexdigest()
+
+
+class ResponseCache:
+    """LRU cache of rendered responses keyed by (route, user, version).
+
+    Entries are (etag, body, mimetype). Because the data version is part of
+    the key, a write never has to find and drop the entries it affects: they
+    simply stop being asked for and age out of the LRU order.
+    """
+
+    def __init__(self, max_entries=512):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        entry = (strong_etag(body), body, mimetype)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def benchmark_cache(render_ms=20.0, requests=2000, users=50, writes_every=200):
+    """Average cost per request of rendering every hit versus serving from the cache.
+
+    ``render_ms`` stands in for the page's computation and templating; a
+    write bumps the version every ``writes_every`` requests.
+    """
+    version = DataVersion()
+    cache = ResponseCache()
+    body = b"x" * 20000
+
+    def render():
+        time.sleep(render_ms / 1000.0)
+        return body
+
+    start = time.perf_counter()
+    for _ in range(requests // 20):
+        render()
+    uncached = (time.perf_counter() - start) / (requests // 20)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        if i and i % writes_every == 0:
+            version.bump()
+        key = ("/dashboard", str(i % users), version.value)
+        if cache.get(key) is None:
+            cache.put(key, render(), "text/html")
+    cached = (time.perf_counter() - start) / requests
+
+    return {"uncached_ms": 1000.0 * uncached, "cached_ms": 1000.0 * cached, **cache.stats()}
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    results = benchmark_cache(requests=requests)
+    print(f"render every request: {results['uncached_ms']:8.3f} ms/request")
+    print(f"versioned cache:      {results['cached_ms']:8.3f} ms/request "
+          f"({results['hits']} hits, {results['misses']} misses)")
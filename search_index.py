@@ -0,0 +1,305 @@
+import bisect
+import heapq
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+GRAM_SIZE = 3
+
+
+def grams(text):
+    """The distinct character trigrams of an already lower-cased string"""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def date_number(date):
+    """"YYYY-MM-DD" as an integer YYYYMMDD, which orders the same way and can be negated"""
+    return int(date.replace("-", ""))
+
+
+def number_date(number):
+    return f"{number // 10000:04d}-{number // 100 % 100:02d}-{number % 100:02d}"
+
+
+def match_rank(query, student_id, name, department):
+    """Rank of a match (lower is better), or None if query is not a substring of any field"""
+    if query == student_id or query == name:
+        return 0
+    if (student_id.startswith(query) or name.startswith(query)
+            or any(word.startswith(query) for word in name.split())):
+        return 1
+    if department.startswith(query):
+        return 2
+    if query in student_id or query in name or query in department:
+        return 3
+    return None
+
+
+class NgramIndex:
+    """Trigram postings over documents with a (student_id, name, department) text key.
+
+    Queries of three or more characters intersect the postings of their
+    trigrams, smallest first, and confirm the candidates with a substring
+    test, so results are exactly those of the old case-insensitive scan.
+    Shorter queries check every document. Results for the most recent
+    ``cache_size`` queries are kept until a document is added or removed.
+    """
+
+    def __init__(self, cache_size=256):
+        self.fields = {}
+        self.postings = defaultdict(set)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def _grams(self, fields):
+        result = set()
+        for field in fields:
+            result |= grams(field)
+        return result
+
+    def add(self, doc_id, student_id, name, department):
+        fields = (student_id.lower(), name.lower(), department.lower())
+        if self.fields.get(doc_id) == fields:
+            return
+        self.remove(doc_id)
+        self.cache.clear()
+        self.fields[doc_id] = fields
+        for gram in self._grams(fields):
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        fields = self.fields.pop(doc_id, None)
+        if fields is None:
+            return
+        self.cache.clear()
+        for gram in self._grams(fields):
+            postings = self.postings[gram]
+            postings.discard(doc_id)
+            if not postings:
+                del self.postings[gram]
+
+    def search(self, query):
+        """[(rank, doc_id)] for every document matching query"""
+        query = query.lower().strip()
+        if not query:
+            return []
+        if query in self.cache:
+            self.cache.move_to_end(query)
+            return self.cache[query]
+
+        if len(query) < GRAM_SIZE:
+            candidates = self.fields
+        else:
+            sets = []
+            for gram in grams(query):
+                postings = self.postings.get(gram)
+                if not postings:
+                    sets = [set()]
+                    break
+                sets.append(postings)
+            sets.sort(key=len)
+            candidates = set.intersection(*sets)
+
+        results = []
+        for doc_id in candidates:
+            rank = match_rank(query, *self.fields[doc_id])
+            if rank is not None:
+                results.append((rank, doc_id))
+
+        self.cache[query] = results
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return results
+
+
+class SearchIndex:
+    """Ranked, paginated search over students and attendance rows.
+
+    Students are indexed by id, name and department. Attendance rows are
+    grouped by their distinct (student_id, name, department) key, which is
+    what is matched; each key keeps its rows' dates sorted, so matching keys
+    are expanded into rows lazily, best rank first and newest first within
+    a rank, and only as far as the requested page.
+
+    The index listens to a UserRegistry and an AttendanceIndex and is
+    updated incrementally as users are saved and marks are indexed.
+    """
+
+    def __init__(self, attendance_index=None, user_registry=None):
+        self.lock = threading.Lock()
+        self.students = NgramIndex()
+        self.student_names = {}
+        self.keys = NgramIndex()
+        self.key_ids = {}
+        self.key_students = {}
+        self.key_dates = {}
+        self.next_key = 0
+        self.attendance_index = attendance_index
+        self.user_registry = user_registry
+        if attendance_index is not None:
+            attendance_index.add_listener(self.attendance_changed)
+        if user_registry is not None:
+            user_registry.add_listener(self.user_changed)
+
+    # Incremental updates
+
+    def user_changed(self, student_id, old, new):
+        with self.lock:
+            if new is None:
+                self.students.remove(student_id)
+                self.student_names.pop(student_id, None)
+            else:
+                name = new.get("name", "")
+                self.students.add(student_id, student_id, name, new.get("department", ""))
+                self.student_names[student_id] = name.lower()
+
+    def _key(self, student_id, entry):
+        return student_id, entry.get("name", ""), entry.get("department", "")
+
+    def attendance_changed(self, date, student_id, old, new):
+        with self.lock:
+            if old is not None:
+                key = self._key(student_id, old)
+                key_id = self.key_ids[key]
+                dates = self.key_dates[key_id]
+                del dates[bisect.bisect_left(dates, date_number(date))]
+                if not dates:
+                    del self.key_ids[key]
+                    del self.key_students[key_id]
+                    del self.key_dates[key_id]
+                    self.keys.remove(key_id)
+            if new is not None:
+                key = self._key(student_id, new)
+                key_id = self.key_ids.get(key)
+                if key_id is None:
+                    key_id = self.key_ids[key] = self.next_key
+                    self.next_key += 1
+                    self.key_students[key_id] = student_id
+                    self.key_dates[key_id] = []
+                    self.keys.add(key_id, *key)
+                bisect.insort(self.key_dates[key_id], date_number(date))
+
+    # Queries
+
+    def _refresh(self):
+        # Pull in changes first; the sources call back into this index
+        if self.user_registry is not None:
+            self.user_registry.all()
+        if self.attendance_index is not None:
+            self.attendance_index.refresh()
+
+    def search_students(self, query, page=1, per_page=50, limit=1000):
+        """(student_ids for the page, total matches up to limit), best match first"""
+        self._refresh()
+        with self.lock:
+            ranked = sorted(
+                self.students.search(query),
+                key=lambda item: (item[0], self.student_names.get(item[1], ""), item[1]),
+            )
+        ranked = ranked[:limit]
+        start = (max(1, page) - 1) * per_page
+        return [student_id for _, student_id in ranked[start:start + per_page]], len(ranked)
+
+    def search_attendance(self, query, page=1, per_page=50, limit=1000):
+        """([(date, student_id)] for the page, total matches up to limit).
+
+        Rows are ordered by rank, then newest first.
+        """
+        self._refresh()
+        start = (max(1, page) - 1) * per_page
+        stop = min(start + per_page, limit)
+        with self.lock:
+            matches = self.keys.search(query)
+            total = min(limit, sum(len(self.key_dates[key_id]) for _, key_id in matches))
+
+            by_rank = defaultdict(list)
+            for rank, key_id in matches:
+                by_rank[rank].append(key_id)
+
+            rows = []
+            for rank in sorted(by_rank):
+                # k-way merge of the keys' date lists, newest first
+                heap = []
+                for key_id in by_rank[rank]:
+                    dates = self.key_dates[key_id]
+                    heap.append((-dates[-1], key_id, len(dates) - 1))
+                heapq.heapify(heap)
+                while heap and len(rows) < stop:
+                    negative_date, key_id, position = heap[0]
+                    rows.append((number_date(-negative_date), self.key_students[key_id]))
+                    if position:
+                        position -= 1
+                        heapq.heapreplace(
+                            heap, (-self.key_dates[key_id][position], key_id, position)
+                        )
+                    else:
+                        heapq.heappop(heap)
+                if len(rows) >= stop:
+                    break
+        return rows[start:stop], total
+
+
+def benchmark_search(rows=1000000, students=5000, queries=500, per_page=50, seed=0):
+    """p50/p99 latency of attendance searches over ``rows`` indexed rows"""
+    rng = random.Random(seed)
+    first_names = ["Ali", "Sara", "Omar", "Noor", "Zaid", "Huda", "Yusuf", "Maryam", "Hassan", "Layla"]
+    last_names = ["Kareem", "Hadi", "Jaber", "Saleh", "Mahdi", "Nasser", "Taha", "Rashid"]
+    departments = ["IT", "Chemistry", "English", "Microbiology"]
+    people = [
+        (str(i).zfill(6), f"{rng.choice(first_names)} {rng.choice(last_names)} {i}", rng.choice(departments))
+        for i in range(students)
+    ]
+
+    index = SearchIndex()
+    days = rows // students
+    start = time.perf_counter()
+    for day in range(days):
+        date = f"{2000 + day // 336}-{day // 28 % 12 + 1:02d}-{day % 28 + 1:02d}"
+        for student_id, name, department in people:
+            index.attendance_changed(date, student_id, None, {"name": name, "department": department})
+    for student_id, name, department in people:
+        index.user_changed(student_id, None, {"name": name, "department": department})
+    build = time.perf_counter() - start
+
+    samples = []
+    for _ in range(queries):
+        student_id, name, department = rng.choice(people)
+        kind = rng.random()
+        if kind < 0.3:
+            samples.append(student_id[-4:])
+        elif kind < 0.6:
+            word = rng.choice(name.split())
+            samples.append(word[:rng.randint(2, len(word))])
+        elif kind < 0.8:
+            samples.append(name.lower())
+        else:
+            samples.append(department[:rng.randint(2, len(department))])
+
+    def measure(search):
+        latencies = []
+        for query in samples:
+            start = time.perf_counter()
+            search(query)
+            latencies.append(1000.0 * (time.perf_counter() - start))
+        latencies.sort()
+        return statistics.median(latencies), latencies[int(0.99 * (len(latencies) - 1))]
+
+    return {
+        "rows": days * students,
+        "build_s": build,
+        "attendance_ms": measure(lambda q: index.search_attendance(q, per_page=per_page)),
+        "attendance_page_10_ms": measure(lambda q: index.search_attendance(q, page=10, per_page=per_page)),
+        "students_ms": measure(lambda q: index.search_students(q, per_page=per_page)),
+    }
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    results = benchmark_search(rows)
+    print(f"{results['rows']} attendance rows indexed in {results['build_s']:.1f}s")
+    for name in ("attendance_ms", "attendance_page_10_ms", "students_ms"):
+        p50, p99 = results[name]
+        print(f"{name[:-3]:<22} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
@@ -0,0 +1,152 @@
+import sys
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+
+from attendance_storage import JsonStorage
+
+
+class UserRegistry:
+    """Cached users from the storage, reloaded only when they change on disk.
+
+    Every read first compares the storage's cheap users signature (the
+    file's mtime and size, or the table's row count and rowid in SQLite)
+    with the one loaded; only a change triggers a reload. Reads return
+    read-only MappingProxyType views of the cache, so nothing is copied per
+    request and callers cannot modify the shared data by accident: take a
+    ``dict(...)`` of a user, change it, and pass it to ``save``.
+
+    ``save`` writes through the storage, which replaces the file atomically
+    under its lock, and updates the cached user immediately. The cache is
+    never changed in place: reloads and saves swap in a new dictionary, so
+    a view a request is iterating stays consistent.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.Lock()
+        self.signature = None
+        self.loaded = False
+        self.users = {}
+        self.view = MappingProxyType(self.users)
+        self.reloads = 0
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(student_id, old_user, new_user) whenever a user is added, changed or removed"""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def _notify(self, old_users, new_users):
+        for student_id, user in new_users.items():
+            old = old_users.get(student_id)
+            if old != user:
+                for listener in self.listeners:
+                    listener(student_id, old, user)
+        for student_id, old in old_users.items():
+            if student_id not in new_users:
+                for listener in self.listeners:
+                    listener(student_id, old, None)
+
+    def _refresh(self):
+        signature = self.storage.users_signature()
+        if self.loaded and signature == self.signature:
+            return
+        with self.lock:
+            if self.loaded and signature == self.signature:
+                return
+            users = {
+                student_id: MappingProxyType(info)
+                for student_id, info in self.storage.load_users().items()
+            }
+            if self.listeners:
+                self._notify(self.users, users)
+            self.users = users
+            self.view = MappingProxyType(users)
+            self.signature = signature
+            self.loaded = True
+            self.reloads += 1
+
+    def all(self):
+        """Read-only {student_id: user} for every user"""
+        self._refresh()
+        return self.view
+
+    def get(self, student_id, default=None):
+        self._refresh()
+        return self.users.get(student_id, default)
+
+    def __contains__(self, student_id):
+        self._refresh()
+        return student_id in self.users
+
+    def __len__(self):
+        self._refresh()
+        return len(self.users)
+
+    def save(self, student_id, info):
+        """Write one user through to the storage and the cache"""
+        info = dict(info)
+        self.storage.save_user(student_id, info)
+        with self.lock:
+            users = dict(self.users)
+            users[student_id] = MappingProxyType(info)
+            for listener in self.listeners:
+                listener(student_id, self.users.get(student_id), users[student_id])
+            self.users = users
+            self.view = MappingProxyType(users)
+
+
+def benchmark_registry(users=50000, requests=2000):
+    """Per-request cost of looking a user up, with and without the registry"""
+    directory = tempfile.mkdtemp(prefix="user_registry_")
+    storage = JsonStorage(directory)
+    storage.save_users({
+        str(i).zfill(6): {
+            "name": f"Student {i}",
+            "department": "IT",
+            "photo_path": f"face_data/user_{i}.jpg",
+            "password": "pbkdf2:sha256:600000$" + "x" * 80,
+            "registration_date": "2024-01-01 00:00:00",
+        }
+        for i in range(users)
+    })
+    ids = [str(i * 7919 % users).zfill(6) for i in range(requests)]
+
+    start = time.perf_counter()
+    for student_id in ids[:max(1, requests // 100)]:
+        storage.load_users()[student_id]
+    reparse = (time.perf_counter() - start) / max(1, requests // 100)
+
+    registry = UserRegistry(storage)
+    start = time.perf_counter()
+    registry.get(ids[0])
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for student_id in ids:
+        registry.get(student_id)
+    cached = (time.perf_counter() - start) / requests
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        len(registry.all())
+    listing = (time.perf_counter() - start) / requests
+
+    return {
+        "reparse_ms": 1000.0 * reparse,
+        "first_load_ms": 1000.0 * first,
+        "cached_lookup_us": 1e6 * cached,
+        "cached_all_us": 1e6 * listing,
+    }
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    results = benchmark_registry(users)
+    print(f"{users} users")
+    print(f"re-read user_records.json per request: {results['reparse_ms']:9.2f} ms")
+    print(f"registry first load:                   {results['first_load_ms']:9.2f} ms")
+    print(f"registry lookup per request:           {results['cached_lookup_us']:9.2f} us")
+    print(f"registry all users per request:        {results['cached_all_us']:9.2f} us")